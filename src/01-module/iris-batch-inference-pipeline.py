@@ -4,8 +4,8 @@
 # 
 # In this notebook we will, 
 # 
-# 1. Load the batch inference data that arrived in the last 24 hours
-# 2. Predict the first Iris Flower found in the batch
+# 1. Load the batch inference data that arrived since the previous run
+# 2. Predict the last Iris Flower found in the batch
 # 3. Write the ouput png of the Iris flower predicted, to be displayed in Github Pages.
 
 # %%
@@ -35,46 +35,94 @@ feature_view = fs.get_feature_view(name="iris_test_class", version=1)
 # %% [markdown]
 # Now we will do some **Batch Inference**. 
 # 
-# We will read all the input features that have arrived in the last 24 hours, and score them.
+# We will read only the iris flowers that have arrived since the previous run, and score them. Every insert into the
+# feature group is a commit, and the last commit that was scored (the watermark) is kept in 'iris_watermark.json',
+# committed with the other assets. The new rows are read with an incremental query over the commits after it, so a
+# run reads the same few rows however large the feature group grows. At most the rows of the last LATEST_N commits
+# are scored, which also bounds the first run, without a watermark.
 
 # %%
-import datetime
-from PIL import Image
+import json
+import os
 
-batch_data = feature_view.get_batch_data()
+WATERMARK = "../../assets/iris_watermark.json"
+LATEST_N = int(os.environ.get("LATEST_N", "1"))
 
+iris_fg = fs.get_feature_group(name="iris_test_class", version=1)
+# commit ids are the commit times in milliseconds
+commits = sorted(int(commit) for commit in iris_fg.commit_details(limit=LATEST_N + 1))
+latest_commit = commits[-1]
+
+watermark = commits[0] if len(commits) > LATEST_N else None
+if os.path.exists(WATERMARK):
+    with open(WATERMARK) as f:
+        last_scored = json.load(f)["commit"]
+    watermark = last_scored if watermark is None else max(watermark, last_scored)
+
+if watermark == latest_commit:
+    print("No new iris flowers since the previous run")
+    raise SystemExit(0)
+
+# %%
+# The query of the feature view, with the label, over the commits after the watermark up to the latest one
+new_df = feature_view.query.as_of(latest_commit, exclude_until=watermark).read()
+
+batch_data = new_df.drop(columns=["variety"])
 y_pred = model.predict(batch_data)
 
 y_pred
 
 # %%
-batch_data
+new_df
 
 # %% [markdown]
-# Batch prediction output is the last entry in the batch - it is output as a file 'latest_iris.png'
+# The images written to '../../assets' are only rendered again when the data they show has changed. The hash of
+# the input of each image is kept in 'render_hashes.json', committed with the images, and the plotting libraries
+# are imported by the render functions, so a run whose images are all unchanged does not import them at all.
 
 # %%
-flower = y_pred[y_pred.size-1]
-flower_img = "assets/" + flower + ".png"
-img = Image.open(flower_img)            
+import hashlib
+
+RENDER_HASHES = "../../assets/render_hashes.json"
+
+render_hashes = {}
+if os.path.exists(RENDER_HASHES):
+    with open(RENDER_HASHES) as f:
+        render_hashes = json.load(f)
 
-img.save("../../assets/latest_iris.png")
+
+def render_if_changed(path, data, render):
+    """Call render(path) unless `path` exists and was rendered from the same `data` (anything JSON serializable)."""
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    if os.path.exists(path) and render_hashes.get(path) == digest:
+        print(f"{path} is unchanged")
+        return False
+    render(path)
+    render_hashes[path] = digest
+    return True
+
+
+def copy_flower_image(flower):
+    def render(path):
+        from PIL import Image
+        Image.open("assets/" + flower + ".png").save(path)
+    return render
+
+
+# %% [markdown]
+# Batch prediction output is the last entry in the batch - it is output as a file 'latest_iris.png'
 
 # %%
-iris_fg = fs.get_feature_group(name="iris_test_class", version=1)
-df = iris_fg.read()
-df
+flower = y_pred[y_pred.size-1]
+render_if_changed("../../assets/latest_iris.png", flower, copy_flower_image(flower))
 
 # %%
-label = df.iloc[-1]["variety"]
+# The label of the flower we predicted last, from the rows read above rather than the whole feature group
+label = new_df.iloc[-1]["variety"]
 label
 
 # %%
-label_flower = "assets/" + label + ".png"
-
-img = Image.open(label_flower)            
-
-img.save("../../assets/actual_iris.png")
+render_if_changed("../../assets/actual_iris.png", label, copy_flower_image(label))
 
 # %%
 import pandas as pd
@@ -97,48 +145,94 @@ data = {
 monitor_df = pd.DataFrame(data)
 monitor_fg.insert(monitor_df)
 
+# %% [markdown]
+# The monitoring feature group grows with every run, so we don't read all of it back to draw the outputs.
+# Instead, running totals are kept in 'iris_monitoring.json', committed with the other assets: a counter of
+# (label, prediction) pairs, which is the confusion matrix, and the last 5 predictions. Each run adds only its own
+# prediction. The totals are rebuilt from the whole feature group when the file is missing, or when
+# REBUILD_MONITORING=1 is set.
+
 # %%
-history_df = monitor_fg.read()
-history_df
+MONITORING_STATE = "../../assets/iris_monitoring.json"
+RECENT_ROWS = 5
+
+
+def add_predictions(state, monitor_df):
+    for row in monitor_df.to_dict("records"):
+        label_counts = state["counts"].setdefault(row["label"], {})
+        label_counts[row["prediction"]] = label_counts.get(row["prediction"], 0) + 1
+        state["recent"].append(row)
+    state["recent"] = state["recent"][-RECENT_ROWS:]
+    return state
+
+
+rebuild = os.environ.get("REBUILD_MONITORING", "0") == "1" or not os.path.exists(MONITORING_STATE)
+if rebuild:
+    history_df = monitor_fg.read()
+    state = add_predictions({"counts": {}, "recent": []}, history_df[["prediction", "label", "datetime"]])
+else:
+    with open(MONITORING_STATE) as f:
+        state = add_predictions(json.load(f), monitor_df)
+
+with open(MONITORING_STATE + ".tmp", "w") as f:
+    json.dump(state, f, indent=1)
+os.replace(MONITORING_STATE + ".tmp", MONITORING_STATE)
+state
 
 # %%
 #!pip install dataframe_image -q
 
 # %%
-import dataframe_image as dfi
+df_recent = pd.DataFrame(state["recent"])
 
-df_recent = history_df.tail(5)
- 
-# If you exclude this image, you may have the same iris_latest.png and iris_actual.png files
-# If no files have changed, the GH-action 'git commit/push' stage fails, failing your GH action (last step)
-# This image, however, is always new, ensuring git commit/push will succeed.
-dfi.export(df_recent, '../../assets/df_recent.png', table_conversion = 'matplotlib')
 
-# %%
-from sklearn.metrics import confusion_matrix
+def export_df_recent(path):
+    import dataframe_image as dfi
+    dfi.export(df_recent, path, table_conversion = 'matplotlib')
 
-predictions = history_df[['prediction']]
-labels = history_df[['label']]
 
-results = confusion_matrix(labels, predictions)
-print(results)
+# The GH-action 'git commit/push' stage fails if no files have changed, but 'iris_monitoring.json' changes on
+# every run, so the images can be left as they are.
+render_if_changed('../../assets/df_recent.png', state["recent"], export_df_recent)
 
 # %%
-from matplotlib import pyplot
-import seaborn as sns
+import numpy as np
 
+# Same matrix as sklearn's confusion_matrix over the whole history: rows are labels, columns predictions,
+# over the flowers seen in either
+flowers = sorted(set(state["counts"]) | {p for counts in state["counts"].values() for p in counts})
+results = np.array([[state["counts"].get(label, {}).get(prediction, 0) for prediction in flowers]
+                    for label in flowers])
+print(results)
+
+# %%
 # Only create the confusion matrix when our iris_predictions feature group has examples of all 3 iris flowers
 if results.shape == (3,3):
 
     df_cm = pd.DataFrame(results, ['True Setosa', 'True Versicolor', 'True Virginica'],
                          ['Pred Setosa', 'Pred Versicolor', 'Pred Virginica'])
 
-    cm = sns.heatmap(df_cm, annot=True)
+    def plot_confusion_matrix(path):
+        import seaborn as sns
+        cm = sns.heatmap(df_cm, annot=True)
+        fig = cm.get_figure()
+        fig.savefig(path)
 
-    fig = cm.get_figure()
-    fig.savefig("../../assets/confusion_matrix.png") 
+    render_if_changed("../../assets/confusion_matrix.png", results.tolist(), plot_confusion_matrix)
     df_cm
 else:
-    print("Run the batch inference pipeline more times until you get 3 different iris flowers")    
+    print("Run the batch inference pipeline more times until you get 3 different iris flowers")
+
+# %%
+with open(RENDER_HASHES + ".tmp", "w") as f:
+    json.dump(render_hashes, f, indent=1, sort_keys=True)
+os.replace(RENDER_HASHES + ".tmp", RENDER_HASHES)
+
+# %%
+# The rows up to the latest commit have been scored and recorded: move the watermark last, so a run that fails
+# before this point scores them again
+with open(WATERMARK + ".tmp", "w") as f:
+    json.dump({"commit": latest_commit}, f)
+os.replace(WATERMARK + ".tmp", WATERMARK)    
 
 
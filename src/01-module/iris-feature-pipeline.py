@@ -6,8 +6,9 @@
 # 1. Run in either "Backfill" or "Normal" operation. 
 # 2. IF *BACKFILL==True*, we will load our DataFrame with data from the iris.csv file 
 # 
-#    ELSE *BACKFILL==False*, we will load our DataFrame with one synthetic Iris Flower sample 
-# 3. Write our DataFrame to a Feature Group
+#    ELSE *BACKFILL==False*, we will load our DataFrame with N_FLOWERS synthetic Iris Flower samples (one by default)
+# 3. Write our DataFrame to a Feature Group, or with IRIS_HIGH_RATE=1, write many batches of synthetic flowers to
+#    load-test the insert path
 
 # %%
 #!pip install -U hopsworks --quiet
@@ -16,50 +17,69 @@
 # Set **BACKFILL=True** if you want to create features from the iris.csv file containing historical data.
 
 # %%
-import random
+import os
+import time
+import numpy as np
 import pandas as pd
 import hopsworks
 
 BACKFILL=False
 
+# Number of synthetic flowers per insert, and the share of each variety, e.g. IRIS_CLASS_MIX="Setosa=2,Virginica=1"
+N_FLOWERS = int(os.environ.get("N_FLOWERS", "1"))
+CLASS_MIX = {name: float(weight) for name, weight in
+             (item.split("=") for item in os.environ.get("IRIS_CLASS_MIX", "").split(",") if item)} or None
+# High-rate mode: insert IRIS_HIGH_RATE_BATCHES batches of N_FLOWERS flowers, one after the other
+HIGH_RATE = os.environ.get("IRIS_HIGH_RATE", "0") == "1"
+HIGH_RATE_BATCHES = int(os.environ.get("IRIS_HIGH_RATE_BATCHES", "100"))
+
 # %% [markdown]
 # ### Synthetic Data Functions
 # 
-# These synthetic data functions can be used to create a DataFrame containing a single Iris Flower sample.
+# These synthetic data functions can be used to create a DataFrame containing a single Iris Flower sample, or
+# many at once.
 
 # %%
-def generate_flower(name, sepal_len_max, sepal_len_min, sepal_width_max, sepal_width_min, 
-                    petal_len_max, petal_len_min, petal_width_max, petal_width_min):
+# (sepal_len_max, sepal_len_min, sepal_width_max, sepal_width_min,
+#  petal_len_max, petal_len_min, petal_width_max, petal_width_min) of each variety
+IRIS_RANGES = {
+    "Virginica": (8, 5.5, 3.8, 2.2, 7, 4.5, 2.5, 1.4),
+    "Versicolor": (7.5, 4.5, 3.5, 2.1, 3.1, 5.5, 1.8, 1.0),
+    "Setosa": (6, 4.5, 4.5, 2.3, 1.2, 2, 0.7, 0.3),
+}
+PRIMARY_KEY = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+def generate_flowers(n, class_mix=None, rng=None):
     """
-    Returns a single iris flower as a single row in a DataFrame
+    Returns a DataFrame of n random iris flowers, drawn together with NumPy rather than one DataFrame per flower.
+    class_mix maps varieties to their relative weights (all three equally likely by default).
     """
-    df = pd.DataFrame({ "sepal_length": [random.uniform(sepal_len_max, sepal_len_min)],
-                       "sepal_width": [random.uniform(sepal_width_max, sepal_width_min)],
-                       "petal_length": [random.uniform(petal_len_max, petal_len_min)],
-                       "petal_width": [random.uniform(petal_width_max, petal_width_min)]
-                      })
-    df['variety'] = name
+    rng = rng if rng is not None else np.random.default_rng()
+    class_mix = class_mix or {name: 1.0 for name in IRIS_RANGES}
+    names = list(class_mix)
+    weights = np.array([class_mix[name] for name in names], dtype=float)
+    varieties = rng.choice(len(names), size=n, p=weights / weights.sum())
+
+    # columns of (max, min) bounds of the 4 features, for every flower
+    ranges = np.array([IRIS_RANGES[name] for name in names], dtype=float)[varieties]
+    highs, lows = ranges[:, 0::2], ranges[:, 1::2]
+    df = pd.DataFrame(lows + (highs - lows) * rng.random((n, 4)), columns=PRIMARY_KEY)
+    df['variety'] = np.array(names, dtype=object)[varieties]
     return df
 
 
-def get_random_iris_flower():
+def dedupe_flowers(df, seen):
     """
-    Returns a DataFrame containing one random iris flower
+    Drops the flowers whose primary key (the 4 feature values) is in the set seen, or repeated in df, and adds the
+    keys of the others to seen, so an insert never holds two rows with the same primary key.
     """
-    virginica_df = generate_flower("Virginica", 8, 5.5, 3.8, 2.2, 7, 4.5, 2.5, 1.4)
-    versicolor_df = generate_flower("Versicolor", 7.5, 4.5, 3.5, 2.1, 3.1, 5.5, 1.8, 1.0)
-    setosa_df =  generate_flower("Setosa", 6, 4.5, 4.5, 2.3, 1.2, 2, 0.7, 0.3)
-
-    # randomly pick one of these 3 and write it to the featurestore
-    pick_random = random.uniform(0,3)
-    if pick_random >= 2:
-        iris_df = virginica_df
-    elif pick_random >= 1:
-        iris_df = versicolor_df
-    else:
-        iris_df = setosa_df
+    keys = list(zip(*(df[column].tolist() for column in PRIMARY_KEY)))
+    keep = []
+    for key in keys:
+        keep.append(key not in seen)
+        seen.add(key)
+    return df[keep]
 
-    return iris_df
 
 # %% [markdown]
 # ## Backfill or create new synthetic input data
@@ -68,12 +88,13 @@ def get_random_iris_flower():
 
 # %%
 
-if BACKFILL == True:
+# in high-rate mode, the batches are generated in the loop below instead
+if HIGH_RATE:
+    iris_df = None
+elif BACKFILL == True:
     iris_df = pd.read_csv("https://repo.hops.works/master/hopsworks-tutorials/data/iris.csv")
 else:
-    iris_df = get_random_iris_flower()
-    
-iris_df.head()
+    iris_df = generate_flowers(N_FLOWERS, CLASS_MIX)
 
 # %% [markdown]
 # ## Authenticate with Hopsworks using your API Key
@@ -90,7 +111,8 @@ fs = project.get_feature_store()
 # To prevent duplicate entries, Hopsworks requires that each DataFame has a *primary_key*. 
 # A *primary_key* is one or more columns that uniquely identify the row. Here, we assume
 # that each Iris flower has a unique combination of ("sepal_length","sepal_width","petal_length","petal_width")
-# feature values. If you randomly generate a sample that already exists in the feature group, the insert operation will fail.
+# feature values. If you randomly generate a sample that already exists in the feature group, the insert updates
+# (upserts) the existing row with that primary key.
 # 
 # The *feature group* will create its online schema using the schema of the Pandas DataFame.
 
@@ -100,6 +122,27 @@ iris_fg = fs.get_or_create_feature_group(name="iris_test_class",
                                   primary_key=["sepal_length","sepal_width","petal_length","petal_width"],
                                   description="Iris flower dataset"
                                  )
-iris_fg.insert(iris_df)
+# keys repeated within this run are dropped; a flower already in the feature group is upserted on its primary key
+seen = set()
+if not HIGH_RATE:
+    iris_fg.insert(dedupe_flowers(iris_df, seen))
+
+# %% [markdown]
+# ## High-rate mode
+# 
+# To load-test the insert path of the feature group, insert IRIS_HIGH_RATE_BATCHES batches of N_FLOWERS synthetic
+# flowers without waiting for the ingestion jobs, and report the insert rate.
+
+# %%
+if HIGH_RATE:
+    inserted = 0
+    start = time.perf_counter()
+    for _ in range(HIGH_RATE_BATCHES):
+        batch_df = dedupe_flowers(generate_flowers(N_FLOWERS, CLASS_MIX), seen)
+        iris_fg.insert(batch_df, write_options={"wait_for_job": False})
+        inserted += len(batch_df)
+    seconds = time.perf_counter() - start
+    print(f"Inserted {inserted} flowers in {HIGH_RATE_BATCHES} batches in {seconds:.1f}s "
+          f"({inserted / seconds:.0f} flowers/s)")
 
 
@@ -2,6 +2,7 @@ import datetime
 import joblib
 from math import radians
 from sml import cc_features
+from sml import batch_scoring
 
 import pandas as pd
 import numpy as np
@@ -31,13 +32,18 @@ warnings.filterwarnings("ignore")
 project = hopsworks.login()
 fs = project.get_feature_store()
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def retrieve_dataset(fv, start_date, end_date):
+def score_dataset(fv, model, start_date, end_date):
+    # The window is read and scored a few hours at a time, so only one chunk is in memory.
     st.write(36 * "-")
-    print_fancy_header('\n💾 Dataset Retrieving...')
-    batch_data = fv.get_batch_data(start_time = start_date, end_time = end_date)
-    batch_data.drop(["tid", "cc_num", "datetime"], axis = 1, inplace=True)
-    return batch_data
+    print_fancy_header('\n💾 Dataset Retrieving and Scoring...')
+    chunks = batch_scoring.iter_batch_data(fv, start_date, end_date, chunk=datetime.timedelta(hours=6))
+    status = st.empty()
+
+    def show_progress(results_df, summary):
+        status.write(f"✅ Scored {summary['rows']} transactions ({summary['chunks']} chunks)")
+
+    return batch_scoring.run_batch_scoring(chunks, model.predict, drop_columns=["tid", "cc_num", "datetime"],
+                                           on_chunk=show_progress)
 
 
 @st.cache(suppress_st_warning=True, allow_output_mutation=True)
@@ -53,12 +59,11 @@ def get_model(project = project):
     model_dir = model.download()
     return joblib.load(model_dir + "/cc_fraud_model.pkl")
 
-def explore_data(batch_data):
+def explore_data(counts):
     st.write(36 * "-")
     print_fancy_header('\n👁 Data Exploration...')
     labels = ["Suspected of Fraud", "Not Suspected of Fraud"]
-    unique, counts = np.unique(batch_data.fraud.values, return_counts=True)
-    values = counts.tolist()
+    values = [counts.get(1, 0), counts.get(0, 0)]
 
     def plot_pie(values, labels):
         fig = px.pie(values=values, names=labels, title='Distribution of predicted fraud transactions')
@@ -72,9 +77,6 @@ def print_fancy_header(text, font_size=24):
     res = f'<span style="color:#ff5f27; font-size: {font_size}px;">{text}</span>'
     st.markdown(res, unsafe_allow_html=True)
 
-def transform_preds(predictions):
-    return ['Fraud' if pred == 1 else 'Not Fraud' for pred in predictions]    
-
 progress_bar = st.sidebar.header('⚙️ Working Progress')
 progress_bar = st.sidebar.progress(0)
 st.title('🆘 Fraud transactions detection 🆘')
@@ -96,13 +98,8 @@ fv = get_feature_view()
 
 
 if st.button('📊 Make a prediction'):
-    batch_data = retrieve_dataset(fv, start_date, end_date)
-    st.write("✅ Retrieved!")
+    summary = score_dataset(fv, model, start_date, end_date)
     progress_bar.progress(55)
-    predictions = model.predict(batch_data)
-    predictions = transform_preds(predictions)
-    batch_data_to_explore = batch_data.copy()
-    batch_data_to_explore['fraud'] = predictions
-    explore_data(batch_data_to_explore)
+    explore_data(summary["counts"])
 
 st.button("Re-run")
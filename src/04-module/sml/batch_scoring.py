@@ -0,0 +1,210 @@
+import datetime
+import math
+import os
+import time
+
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+def _to_datetime(value)-> datetime.datetime:
+    # date + timedelta(hours=6) is the same date, so windows must be computed on datetimes
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.combine(value, datetime.time())
+
+
+def time_chunks(start_time : datetime.datetime, end_time : datetime.datetime,
+                chunk: datetime.timedelta)-> Iterator[Tuple[datetime.datetime, datetime.datetime]]:
+    """Split [start_time, end_time) into consecutive windows of at most `chunk`, oldest first. Dates are taken
+       as their midnight.
+    """
+    if chunk <= datetime.timedelta(0):
+        raise ValueError("chunk must be positive")
+    start_time, end_time = _to_datetime(start_time), _to_datetime(end_time)
+    while start_time < end_time:
+        chunk_end = min(start_time + chunk, end_time)
+        yield start_time, chunk_end
+        start_time = chunk_end
+
+
+def iter_batch_data(feature_view, start_time : datetime.datetime, end_time : datetime.datetime,
+                    chunk: datetime.timedelta = datetime.timedelta(hours=6), **kwargs)-> Iterator[pd.DataFrame]:
+    """Read the batch data of `feature_view` between `start_time` and `end_time` with one `get_batch_data` call
+       per `chunk` of event time, instead of a single call for the whole window. The start of a window is
+       inclusive and its end exclusive, so every row is read once. Empty windows are skipped. `kwargs` go to
+       `get_batch_data`.
+    """
+    for chunk_start, chunk_end in time_chunks(start_time, end_time, chunk):
+        df = feature_view.get_batch_data(start_time=chunk_start, end_time=chunk_end, **kwargs)
+        if len(df) > 0:
+            yield df
+
+
+def score_chunks(chunks : Iterable[pd.DataFrame], predict : Callable, drop_columns: Iterable[str] = (),
+                 keep_columns: Iterable[str] = (), prediction_column: str = "prediction")-> Iterator[pd.DataFrame]:
+    """Score each chunk with `predict` on its columns other than `drop_columns`, and yield only its
+       `keep_columns` (e.g. the primary key and event time) with the predictions, not a copy of the whole chunk.
+    """
+    drop_columns, keep_columns = list(drop_columns), list(keep_columns)
+    for df in chunks:
+        predictions = np.asarray(predict(df.drop(columns=drop_columns)))
+        results_df = df[keep_columns].reset_index(drop=True)
+        results_df[prediction_column] = predictions
+        yield results_df
+
+
+class ParquetSink:
+    """Appends each results chunk to a Parquet file as a row group, so the file holds the results read so far."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+
+    def __call__(self, df : pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Model of each worker process of a ParallelScorer, loaded once by the pool initializer.
+_worker_model = None
+
+
+def _load_worker_model(load_model : Callable):
+    global _worker_model
+    _worker_model = load_model()
+    # one core per worker: the pool provides the parallelism
+    try:
+        if "n_jobs" in _worker_model.get_params():
+            _worker_model.set_params(n_jobs=1)
+    except AttributeError:
+        # not a scikit-learn estimator, or pickled by an older version missing parameters of the current one
+        pass
+
+
+def _score_block(name: str, shape: Tuple[int, int], dtype: str, columns: Optional[List[str]], start: int,
+                 stop: int)-> Tuple[np.ndarray, float]:
+    shm = SharedMemory(name=name)
+    try:
+        # the block is copied out, so the shared memory can be closed whatever `predict` keeps a reference to
+        block = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[start:stop].copy()
+    finally:
+        shm.close()
+    # CPU time rather than wall time, which would count the time the worker waits for a core
+    started = time.process_time()
+    X = pd.DataFrame(block, columns=columns, copy=False) if columns is not None else block
+    predictions = np.asarray(_worker_model.predict(X))
+    return predictions, time.process_time() - started
+
+
+class ParallelScorer:
+    """Scores a feature matrix in row blocks across a pool of `n_workers` processes, each of which calls
+       `load_model()` once when it starts (e.g. `functools.partial(joblib.load, model_dir + "/xgboost.pkl")`,
+       a picklable callable). The matrix is copied once into a shared memory block, and workers get only the
+       bounds of their rows, not pickled DataFrames. Predictions are put back in input order.
+
+       After each `predict`, `report` holds the scaling of the run: the wall time, the CPU time the workers spent
+       in `model.predict` (about the time of scoring the blocks one after the other on one core), the speedup
+       (their ratio) and the efficiency (speedup per worker), to size batch nodes. The first run also includes
+       starting the workers and loading the model in each.
+
+           with ParallelScorer(functools.partial(joblib.load, model_path), n_workers=8) as scorer:
+               predictions = scorer.predict(features_df)
+               print(scorer.report)
+    """
+
+    def __init__(self, load_model : Callable, n_workers: Optional[int] = None, block_rows: Optional[int] = None):
+        self.n_workers = n_workers or os.cpu_count()
+        self.block_rows = block_rows
+        self.report = None
+        self._executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_load_worker_model,
+                                             initargs=(load_model,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def predict(self, X : Union[pd.DataFrame, np.ndarray])-> np.ndarray:
+        """Predictions of the model for the rows of `X`, a numeric DataFrame (whose column names are passed on to
+           the model) or 2-D array.
+        """
+        started = time.perf_counter()
+        columns = list(X.columns) if isinstance(X, pd.DataFrame) else None
+        matrix = np.ascontiguousarray(X.to_numpy() if columns is not None else X)
+        if matrix.ndim != 2 or matrix.dtype.hasobject:
+            raise ValueError("ParallelScorer needs a numeric feature matrix")
+        n_rows = len(matrix)
+        block_rows = self.block_rows or max(math.ceil(n_rows / (4 * self.n_workers)), 1)
+        bounds = [(start, min(start + block_rows, n_rows)) for start in range(0, n_rows, block_rows)]
+
+        shm = SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        try:
+            np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)[:] = matrix
+            futures = [self._executor.submit(_score_block, shm.name, matrix.shape, matrix.dtype.str, columns, start,
+                                             stop) for start, stop in bounds]
+            results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+        predictions = np.concatenate([block for block, _ in results]) if results else np.empty(0)
+        seconds = time.perf_counter() - started
+        cpu_seconds = sum(block_seconds for _, block_seconds in results)
+        speedup = cpu_seconds / seconds if seconds > 0 else 0.0
+        self.report = {"workers": self.n_workers, "rows": n_rows, "blocks": len(bounds), "seconds": seconds,
+                       "cpu_seconds": cpu_seconds, "speedup": speedup, "efficiency": speedup / self.n_workers,
+                       "rows_per_second": n_rows / seconds if seconds > 0 else 0.0}
+        return predictions
+
+
+def run_batch_scoring(chunks : Iterable[pd.DataFrame], predict : Callable,
+                      sink : Optional[Callable[[pd.DataFrame], None]] = None, drop_columns: Iterable[str] = (),
+                      keep_columns: Iterable[str] = (), prediction_column: str = "prediction",
+                      on_chunk : Optional[Callable[[pd.DataFrame, dict], None]] = None)-> dict:
+    """Score `chunks` one at a time (see `score_chunks`) and pass the results of each to `sink`, e.g. a
+       `ParquetSink` or `lambda df: results_fg.insert(df, write_options={"wait_for_job": False})`, as soon
+       as it is scored. Only one chunk is held at a time, so memory does not grow with the window.
+       `on_chunk` is called after each chunk with its results and the summary so far, e.g. for a progress bar.
+
+       Returns a summary: the number of chunks and rows, the count of each predicted class, and the seconds
+       until the first results reached the sink and in total.
+    """
+    start = time.perf_counter()
+    summary = {"chunks": 0, "rows": 0, "counts": {}, "first_results_seconds": None, "seconds": 0.0}
+    for results_df in score_chunks(chunks, predict, drop_columns, keep_columns, prediction_column):
+        if sink is not None:
+            sink(results_df)
+        summary["chunks"] += 1
+        summary["rows"] += len(results_df)
+        classes, counts = np.unique(results_df[prediction_column].to_numpy(), return_counts=True)
+        for prediction, count in zip(classes.tolist(), counts.tolist()):
+            summary["counts"][prediction] = summary["counts"].get(prediction, 0) + count
+        if summary["first_results_seconds"] is None:
+            summary["first_results_seconds"] = time.perf_counter() - start
+        if on_chunk is not None:
+            on_chunk(results_df, summary)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
@@ -0,0 +1,83 @@
+"""Load generator for `scoring_server.py`: sends prediction requests over `--concurrency` keep-alive connections
+and reports the throughput and the p50/p95/p99 request latency.
+
+    python scoring_server.py --port 8080 &
+    python load_generator.py --port 8080 --concurrency 64 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+
+async def _post(reader, writer, path, payload):
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = (await reader.readline()).decode("latin-1")
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, value = line.decode("latin-1").split(":", 1)
+        if name.strip().lower() == "content-length":
+            content_length = int(value)
+    response = json.loads(await reader.readexactly(content_length))
+    if not status.split(" ")[1].startswith("2"):
+        raise RuntimeError(f"{status.strip()}: {response}")
+    return response
+
+
+async def _client(host, port, path, n_requests, vectors_per_request, n_features, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            inputs = [[random.random() for _ in range(n_features)] for _ in range(vectors_per_request)]
+            started = time.perf_counter()
+            response = await _post(reader, writer, path, {"inputs": inputs if vectors_per_request > 1 else inputs[0]})
+            latencies.append(time.perf_counter() - started)
+            assert len(response["predictions"]) == vectors_per_request
+    finally:
+        writer.close()
+
+
+async def run(host="127.0.0.1", port=8080, path="/predict", concurrency=32, n_requests=10000,
+              vectors_per_request=1, n_features=11):
+    latencies = []
+    started = time.perf_counter()
+    per_client = [n_requests // concurrency + (i < n_requests % concurrency) for i in range(concurrency)]
+    await asyncio.gather(*[_client(host, port, path, n, vectors_per_request, n_features, latencies)
+                           for n in per_client if n > 0])
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    report = {
+        "requests": len(latencies),
+        "vectors": len(latencies) * vectors_per_request,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "vectors_per_second": round(len(latencies) * vectors_per_request / elapsed, 1),
+        "latency_ms": {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)},
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the micro-batching scoring server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", default="/predict")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--vectors-per-request", type=int, default=1)
+    parser.add_argument("--n-features", type=int, default=11, help="length of the feature vectors of xgboost.pkl")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.host, args.port, args.path, args.concurrency, args.requests,
+                             args.vectors_per_request, args.n_features))
+    print(json.dumps(report, indent=2))
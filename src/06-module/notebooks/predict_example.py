@@ -1,17 +1,61 @@
+import contextlib
+import json
 import os
+import sys
 import numpy as np
-import hsfs
-import joblib
+
+# print the latency histograms to the deployment logs every this many requests
+LATENCY_LOG_EVERY = 1000
+
+def _latency_recorder():
+    # `latency.py` is saved with the model, or comes with the sml package, installed or in the parent directory
+    # of this file when it is run from the notebooks directory (e.g. by `scoring_server.py`)
+    try:
+        from latency import recorder
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        try:
+            from sml.latency import recorder
+        except ImportError:
+            return None
+    return recorder
 
 class Predict(object):
 
     def __init__(self):
         """ Initializes the serving state, reads a trained model"""        
-        # load the trained model
-        self.model = joblib.load(os.environ["ARTIFACT_FILES_PATH"] + "/xgboost.pkl")
+        artifact_path = os.environ["ARTIFACT_FILES_PATH"]
+        # modules saved with the model are imported from its artifacts
+        sys.path.insert(0, artifact_path)
+        self.latency = _latency_recorder()
+        self.requests = 0
+        if os.path.exists(artifact_path + "/xgboost.npz"):
+            # the trees flattened to NumPy arrays, evaluated by `tree_ensemble.py` saved with them, load without xgboost
+            from tree_ensemble import TreeEnsemble
+            try:
+                # attached read-only, so that the worker processes of a host share one copy of the arrays
+                self.model = TreeEnsemble.load(artifact_path + "/xgboost.npz", shared=True)
+            except ImportError:
+                self.model = TreeEnsemble.load(artifact_path + "/xgboost.npz")
+        else:
+            # load the trained model
+            import joblib
+            self.model = joblib.load(artifact_path + "/xgboost.pkl")
+        self.n_features = getattr(self.model, "n_features_in_", None)
         print("Initialization Complete")
 
     def predict(self, inputs):
         """ Serves a prediction request usign a trained model"""        
-        return self.model.predict(np.asarray(inputs).reshape(1, -1)).tolist() # Numpy Arrays are not JSON serializable
+        # `inputs` is either one feature vector or a list of feature vectors, scored together in a single call
+        batch = np.asarray(inputs, dtype=np.float64)
+        if batch.ndim == 1:
+            batch = batch.reshape(1, -1)
+        if batch.ndim != 2 or (self.n_features is not None and batch.shape[1] != self.n_features):
+            raise ValueError(f"Expected feature vectors of length {self.n_features}, got inputs of shape {batch.shape}")
+        with self.latency.timer("model") if self.latency is not None else contextlib.nullcontext():
+            predictions = self.model.predict(batch)
+        self.requests += 1
+        if self.latency is not None and self.requests % LATENCY_LOG_EVERY == 0:
+            print(json.dumps(self.latency.snapshot()))
+        return predictions.tolist() # Numpy Arrays are not JSON serializable
     
@@ -0,0 +1,221 @@
+"""Standalone micro-batching HTTP server around the KServe predictor in `predict_example.py`.
+
+Concurrent requests are queued and scored together: a batch is closed when it holds `--max-batch-size` feature
+vectors or when its first request has waited `--max-wait-ms`, and then goes through a single `Predict.predict` call.
+Requests use the same body as the deployment, `{"inputs": [...]}` with one or more feature vectors, on
+`POST /predict` or `POST /v1/models/<name>:predict`, and get `{"predictions": [...]}` back. `GET /metrics` returns
+the latency histograms of the requests and of the model in the Prometheus text format.
+
+    python scoring_server.py --port 8080 --max-batch-size 64 --max-wait-ms 2
+
+With `--workers N`, N processes accept connections on the same port, and attach the model arrays read-only from
+`xgboost.npz`, so they share one copy of them.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+
+class MicroBatcher(object):
+
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=2.0):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.scored = 0
+
+    async def predict(self, inputs):
+        """ Queues the feature vectors of one request and waits for their predictions"""
+        # Reject malformed requests here, so they don't fail the batch they would be scored in: a request is
+        # queued as a float matrix, so non-numeric values and ragged vectors raise now.
+        vectors = np.asarray(inputs, dtype=np.float64)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        n_features = getattr(self.predictor, "n_features", None)
+        if vectors.ndim != 2 or (n_features is not None and vectors.shape[1] != n_features):
+            raise ValueError(f"Expected feature vectors of length {n_features}")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((vectors, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.queue.get()]
+            size = len(requests[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            try:
+                batch = np.concatenate([vectors for vectors, _ in requests])
+                # Score off the event loop, so requests keep being queued for the next batch meanwhile.
+                predictions = await loop.run_in_executor(None, self.predictor.predict, batch)
+            except Exception as err:
+                if len(requests) == 1:
+                    if not requests[0][1].done():
+                        requests[0][1].set_exception(err)
+                else:
+                    # One bad request must not fail the others of its batch: score them one at a time.
+                    await self._score_alone(requests)
+                continue
+            self.batches += 1
+            self.scored += len(batch)
+            start = 0
+            for vectors, future in requests:
+                # The future is cancelled when the client went away in the meantime.
+                if not future.done():
+                    future.set_result(predictions[start:start + len(vectors)])
+                start += len(vectors)
+
+    async def _score_alone(self, requests):
+        loop = asyncio.get_running_loop()
+        for vectors, future in requests:
+            try:
+                predictions = await loop.run_in_executor(None, self.predictor.predict, vectors)
+            except Exception as err:
+                if not future.done():
+                    future.set_exception(err)
+                continue
+            self.batches += 1
+            self.scored += len(vectors)
+            if not future.done():
+                future.set_result(predictions)
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, value = line.decode("latin-1").split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, headers, body
+
+
+def _response(status, payload, keep_alive, content_type="application/json"):
+    body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+def make_handler(batcher):
+    latency = getattr(batcher.predictor, "latency", None)
+    if latency is None:
+        # the predictor doesn't record latencies: still time the requests, with the recorder it would use
+        from predict_example import _latency_recorder
+        latency = _latency_recorder()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                if method == "GET" and path == "/metrics" and latency is not None:
+                    writer.write(_response("200 OK", latency.to_prometheus(), keep_alive,
+                                           content_type="text/plain; version=0.0.4"))
+                elif method != "POST" or not (path == "/predict" or path.endswith(":predict")):
+                    writer.write(_response("404 Not Found", {"error": f"{method} {path}"}, keep_alive))
+                else:
+                    try:
+                        started = time.perf_counter()
+                        predictions = await batcher.predict(json.loads(body)["inputs"])
+                        if latency is not None:
+                            latency.record("request", time.perf_counter() - started)
+                        writer.write(_response("200 OK", {"predictions": predictions}, keep_alive))
+                    except (KeyError, TypeError, ValueError) as err:
+                        writer.write(_response("400 Bad Request", {"error": str(err)}, keep_alive))
+                    except Exception as err:
+                        writer.write(_response("500 Internal Server Error", {"error": str(err)}, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(predictor, host="127.0.0.1", port=8080, max_batch_size=64, max_wait_ms=2.0, reuse_port=False):
+    batcher = MicroBatcher(predictor, max_batch_size, max_wait_ms)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(make_handler(batcher), host, port, reuse_port=reuse_port or None)
+    print(f"Serving on http://{host}:{port}/predict (max batch size {max_batch_size}, max wait {max_wait_ms} ms)")
+    started = time.perf_counter()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if batcher.batches:
+            print(f"Scored {batcher.scored} vectors in {batcher.batches} batches "
+                  f"(avg {batcher.scored / batcher.batches:.1f}) over {time.perf_counter() - started:.1f} s")
+
+
+def _serve_worker(host, port, max_batch_size, max_wait_ms):
+    from predict_example import Predict
+
+    try:
+        asyncio.run(serve(Predict(), host, port, max_batch_size, max_wait_ms, reuse_port=True))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching scoring server for the fraud model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=1, help="processes accepting connections on the port")
+    parser.add_argument("--artifact-path",
+                        default=os.environ.get("ARTIFACT_FILES_PATH", os.path.dirname(os.path.abspath(__file__))),
+                        help="directory with xgboost.pkl, used as ARTIFACT_FILES_PATH")
+    args = parser.parse_args()
+
+    os.environ["ARTIFACT_FILES_PATH"] = args.artifact_path
+    if args.workers > 1:
+        workers = [multiprocessing.Process(target=_serve_worker,
+                                           args=(args.host, args.port, args.max_batch_size, args.max_wait_ms))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.join()
+    else:
+        from predict_example import Predict
+
+        try:
+            asyncio.run(serve(Predict(), args.host, args.port, args.max_batch_size, args.max_wait_ms))
+        except KeyboardInterrupt:
+            pass
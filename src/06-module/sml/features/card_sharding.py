@@ -0,0 +1,232 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Hashable, Iterable, List, Optional
+
+from sml.features import cc_features
+
+
+class HashRing:
+    """Consistent hashing of card numbers to workers. Every worker owns `replicas` points on a ring of 64-bit
+       hashes, and a card belongs to the worker of the first point at or after the hash of its `cc_num` (the same
+       `pd.util.hash_array` hash as `parallel_features.shard_by_cc_num`). Unlike `hash % n_workers`, adding a
+       worker only moves the cards that the new worker takes over, about 1/n of them, and removing one only moves
+       its own cards; the other cards keep their worker. The assignment is stable across processes and runs.
+    """
+
+    def __init__(self, workers: Iterable[Hashable], replicas: int = 128):
+        self.workers = list(workers)
+        if not self.workers:
+            raise ValueError("A HashRing needs at least one worker")
+        if len(set(self.workers)) != len(self.workers):
+            raise ValueError("Workers must be distinct")
+        self.replicas = replicas
+        labels = np.array([f"{worker}#{i}" for worker in self.workers for i in range(replicas)], dtype=object)
+        points = pd.util.hash_array(labels)
+        order = np.argsort(points, kind="mergesort")
+        self._points = points[order]
+        self._owners = np.repeat(np.arange(len(self.workers)), replicas)[order]
+
+    def __repr__(self)-> str:
+        return f"HashRing({self.workers}, replicas={self.replicas})"
+
+    def with_workers(self, workers: Iterable[Hashable])-> "HashRing":
+        return HashRing(workers, self.replicas)
+
+    def owner_indexes(self, cc_nums)-> np.ndarray:
+        """Positions in `workers` of the owners of `cc_nums`."""
+        hashes = pd.util.hash_array(np.asarray(cc_nums, dtype=np.int64).ravel())
+        points = np.searchsorted(self._points, hashes) % len(self._points)
+        return self._owners[points]
+
+    def owners(self, cc_nums)-> List[Hashable]:
+        return [self.workers[i] for i in self.owner_indexes(cc_nums)]
+
+    def owner(self, cc_num: int)-> Hashable:
+        return self.workers[self.owner_indexes([cc_num])[0]]
+
+    def partition(self, cc_nums)-> Dict[Hashable, np.ndarray]:
+        """Positions in `cc_nums` of the cards of each worker that owns any."""
+        indexes = self.owner_indexes(cc_nums)
+        return {self.workers[i]: np.flatnonzero(indexes == i) for i in np.unique(indexes)}
+
+
+def moved_cards(old_ring : HashRing, new_ring : HashRing, cc_nums)-> np.ndarray:
+    """Which of `cc_nums` change worker between the two rings."""
+    old_owners = np.asarray(old_ring.workers, dtype=object)[old_ring.owner_indexes(cc_nums)]
+    new_owners = np.asarray(new_ring.workers, dtype=object)[new_ring.owner_indexes(cc_nums)]
+    return old_owners != new_owners
+
+
+def _serve_shard(conn, worker, depth: int):
+    """Loop of a shard process: a `CardHistory` of the cards the ring gives to `worker`, and the commands of
+       `ShardedCardHistory` on `conn`.
+    """
+    history = cc_features.CardHistory(depth=depth)
+    while True:
+        command, *args = conn.recv()
+        if command == "close":
+            conn.send(None)
+            conn.close()
+            return
+        # errors are sent back as the reply, so that the worker keeps serving and the parent gets one reply per request
+        try:
+            conn.send(_run_command(history, worker, command, args))
+        except Exception as err:
+            conn.send(err)
+
+
+def _run_command(history : cc_features.CardHistory, worker, command: str, args: list):
+    if command == "update":
+        events, lags, windows = args
+        return [history.update(event, lags, windows) for event in events]
+    if command == "lag_features":
+        events, lags, windows = args
+        return [history.lag_features(event, lags, windows) for event in events]
+    if command == "release":
+        # hand over the cards that the new ring gives to other workers
+        ring, = args
+        cards = history.cards()
+        owners = ring.owners(cards)
+        leaving = [cc_num for cc_num, owner in zip(cards.tolist(), owners) if owner != worker]
+        return history.export_cards(leaving, remove=True)
+    if command == "import":
+        state, = args
+        history.import_cards(state)
+        return len(state["cc_num"])
+    if command == "size":
+        return len(history)
+    raise ValueError(f"Unknown command {command}")
+
+
+def _select(state: Dict[str, np.ndarray], mask: np.ndarray)-> Dict[str, np.ndarray]:
+    return {name: array[mask] for name, array in state.items()}
+
+
+class ShardedCardHistory:
+    """`CardHistory` split across worker processes by a `HashRing`: each process keeps the rings of its own cards
+       only, and every event is routed to the owner of its card, so the lag features are the same as with one
+       history of all cards. `add_worker` and `remove_worker` move just the cards that change owner, with their
+       history, between processes. This is the local multi-process harness of the routing layer: in a deployment
+       the workers are the scoring replicas and the router sits in front of them, using the same ring.
+
+           with ShardedCardHistory(4) as history:
+               features = history.update(events, windows={"1d": cc_features.MILLISECONDS_PER_DAY})
+               moved = history.add_worker()
+    """
+
+    def __init__(self, n_workers: int = 2, depth: int = 4, replicas: int = 128, context: Optional[str] = None):
+        self.depth = depth
+        self._context = multiprocessing.get_context(context)
+        self._connections = {}
+        self._processes = {}
+        self._next_worker = 0
+        for _ in range(n_workers):
+            self._start_worker()
+        self.ring = HashRing(list(self._connections), replicas)
+        self.moved = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def workers(self)-> List[int]:
+        return list(self.ring.workers)
+
+    def _start_worker(self)-> int:
+        worker, self._next_worker = self._next_worker, self._next_worker + 1
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_serve_shard, args=(child_conn, worker, self.depth), daemon=True,
+                                        name=f"card-shard-{worker}")
+        process.start()
+        child_conn.close()
+        self._connections[worker] = conn
+        self._processes[worker] = process
+        return worker
+
+    def _call(self, requests: Dict[int, tuple])-> dict:
+        # send to every worker before waiting for any, so they work in parallel
+        for worker, request in requests.items():
+            self._connections[worker].send(request)
+        # read every reply before raising, so that no worker is left with an unread one for the next call
+        replies = {worker: self._connections[worker].recv() for worker in requests}
+        for reply in replies.values():
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    def _route(self, command: str, events: List[dict], lags, windows)-> List[dict]:
+        events = list(events)
+        if not events:
+            return []
+        positions = self.ring.partition([event["cc_num"] for event in events])
+        replies = self._call({worker: (command, [events[i] for i in shard], lags, windows)
+                              for worker, shard in positions.items()})
+        features = [None] * len(events)
+        for worker, shard in positions.items():
+            for i, shard_features in zip(shard, replies[worker]):
+                features[i] = shard_features
+        return features
+
+    def update(self, events: Iterable[dict], lags: Iterable[int] = None, windows: dict = None)-> List[dict]:
+        """`CardHistory.update` of each event on the worker of its card, in the order of `events`. Events of the
+           same card are recorded in their order.
+        """
+        return self._route("update", events, lags, windows)
+
+    def lag_features(self, events: Iterable[dict], lags: Iterable[int] = None, windows: dict = None)-> List[dict]:
+        return self._route("lag_features", events, lags, windows)
+
+    def _move(self, states: Iterable[Dict[str, np.ndarray]])-> int:
+        moved = 0
+        requests = {}
+        for state in states:
+            for worker, shard in self.ring.partition(state["cc_num"]).items():
+                part = _select(state, shard)
+                requests.setdefault(worker, []).append(part)
+        for worker, parts in requests.items():
+            state = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+            moved += self._call({worker: ("import", state)})[worker]
+        self.moved += moved
+        return moved
+
+    def add_worker(self)-> int:
+        """Start a worker and move to it the cards it owns in the new ring. Returns the number of cards moved."""
+        worker = self._start_worker()
+        self.ring = self.ring.with_workers(self.ring.workers + [worker])
+        released = self._call({other: ("release", self.ring) for other in self.ring.workers if other != worker})
+        return self._move(released.values())
+
+    def remove_worker(self, worker: Optional[int] = None)-> int:
+        """Move the cards of `worker` (by default the last one added) to their owners in the ring without it,
+           and stop it. Returns the number of cards moved.
+        """
+        worker = self.ring.workers[-1] if worker is None else worker
+        if len(self.ring.workers) == 1:
+            raise ValueError("Can't remove the last worker")
+        self.ring = self.ring.with_workers([other for other in self.ring.workers if other != worker])
+        released = self._call({worker: ("release", self.ring)})
+        moved = self._move(released.values())
+        self._stop_worker(worker)
+        return moved
+
+    def shard_sizes(self)-> Dict[int, int]:
+        """Number of cards held by each worker."""
+        return self._call({worker: ("size",) for worker in self.ring.workers})
+
+    def _stop_worker(self, worker: int):
+        conn = self._connections.pop(worker)
+        process = self._processes.pop(worker)
+        conn.send(("close",))
+        conn.recv()
+        conn.close()
+        process.join()
+
+    def close(self):
+        for worker in list(self._connections):
+            self._stop_worker(worker)
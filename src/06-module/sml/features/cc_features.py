@@ -3,6 +3,9 @@ import numpy as np
 
 from datetime import datetime, date
 from math import radians
+from typing import Dict, Iterable, Union
+
+from sml import shared_arrays
 
 # +
 def card_owner_age(trans_df : pd.DataFrame, profiles_df : pd.DataFrame)-> pd.DataFrame:
@@ -60,6 +63,11 @@ def haversine_distance(long: float, lat: float, prev_long: float, prev_lat: floa
     else:
         prev_lat = radians(prev_lat)
     
+    return _haversine(long, lat, prev_long, prev_lat)
+
+
+def _haversine(long, lat, prev_long, prev_lat):
+    # Haversine distance of coordinates already in radians, for scalars, Series or NumPy arrays.
     long_diff = prev_long - long
     lat_diff = prev_lat - lat
 
@@ -86,32 +94,45 @@ def date_to_timestamp(date_obj: datetime)-> int:
 def timestamp_to_date(timestamp: int)-> datetime:
     return datetime.fromtimestamp(timestamp // 1000)
 
-def activity_level(trans_df : pd.DataFrame, lag: int)-> pd.DataFrame:
-    
+def activity_level(trans_df : pd.DataFrame, lag: Union[int, Iterable[int]])-> pd.DataFrame:
+    """Compute `loc_delta_t_minus_{lag}` and `time_delta_t_minus_{lag}` for a single lag, or for each lag of a
+       collection of lags (e.g. {1, 2, 5}) from a single sort of the transactions.
+    """
+    lags = sorted({lag} if isinstance(lag, int) else set(lag))
+
     # Convert coordinates into radians:
     trans_df[["longitude", "latitude"]] = trans_df[["longitude", "latitude"]].applymap(radians)
     
     trans_df.sort_values(["datetime", "cc_num"], inplace=True) 
 
-    # When we call `haversine_distance`, we want to pass as params, the long/lat of the current row, and the long/lat of the most
-    # recent prior purchase. By grouping the DF by cc_num, apart from the first transaction (which will be NaN and we fill that with 0 at the end),
-    # we can access the previous lat/long using Panda's `shift` operation, which gives you the previous row (long/lang).
-    trans_df[f"loc_delta_t_minus_{lag}"] = trans_df.groupby("cc_num")\
-        .apply(lambda x :haversine_distance(x["longitude"], x["latitude"], x["longitude"].shift(-lag), x["latitude"].shift(-lag)))\
-        .reset_index(level=0, drop=True)\
-        .fillna(0)
-
-    # Use the same `shift` operation in Pandas to get the previous row for a given cc_number
-    trans_df[f"time_delta_t_minus_{lag}"] = trans_df.groupby("cc_num")\
-        .apply(lambda x : time_delta(x["datetime"].shift(-lag), x["datetime"]))\
-        .reset_index(level=0, drop=True)
-#        .fillna(0) # handle the first datetime, which has no previous row when you call `shift`
-
-    # Convert time_delta from seconds to days
-    trans_df[f"time_delta_t_minus_{lag}"] = trans_df[f"time_delta_t_minus_{lag}"].map(lambda x: time_delta_to_days(x))
-    trans_df[f"time_delta_t_minus_{lag}"] = trans_df[f"time_delta_t_minus_{lag}"].fillna(0)    
+    # When we call `haversine_distance`, we want to pass as params, the long/lat of the current row, and the long/lat of the
+    # transaction `lag` purchases away from the same card. A stable sort by cc_num of the (time sorted) transactions makes the
+    # transactions of each card contiguous and in time order, so for every lag this is a shifted view of the same arrays, valid
+    # where both ends of the shift belong to the same card. Transactions without one get 0 (like a `shift` filled with 0).
+    by_card = np.argsort(trans_df["cc_num"].to_numpy(), kind="stable")
+    cc_nums = trans_df["cc_num"].to_numpy()[by_card]
+    longitude = trans_df["longitude"].to_numpy()[by_card]
+    latitude = trans_df["latitude"].to_numpy()[by_card]
+    datetimes = trans_df["datetime"].to_numpy()[by_card]
+
+    lag_columns = []
+    for lag in lags:
+        same_card = cc_nums[lag:] == cc_nums[:-lag]
+        positions = by_card[:-lag][same_card]
+
+        loc_delta = np.zeros(len(trans_df))
+        loc_delta[positions] = haversine_distance(pd.Series(longitude[:-lag][same_card]), pd.Series(latitude[:-lag][same_card]),
+                                                  pd.Series(longitude[lag:][same_card]), pd.Series(latitude[lag:][same_card]))
+        trans_df[f"loc_delta_t_minus_{lag}"] = loc_delta
+
+        # Convert time_delta to days
+        days_delta = np.zeros(len(trans_df))
+        days_delta[positions] = time_delta(datetimes[lag:][same_card], datetimes[:-lag][same_card]) / np.timedelta64(1, "D")
+        trans_df[f"time_delta_t_minus_{lag}"] = days_delta
+        lag_columns += [f"loc_delta_t_minus_{lag}", f"time_delta_t_minus_{lag}"]
+
     trans_df = trans_df[["tid","datetime", "month", "cc_num","category", "amount", "city", "country", "age_at_transaction"\
-                         ,"days_until_card_expires", f"loc_delta_t_minus_{lag}", f"time_delta_t_minus_{lag}"]]
+                         ,"days_until_card_expires"] + lag_columns]
     # Convert datetime to timestamp, because of a problem with UTC. Hopsworks assumes you use UTC, but if you don't use UTC
     # on your Python environment, the datetime will be wrong. With timestamps, we don't have the UTC problems when performing PIT Joins.
     trans_df.datetime = trans_df.datetime.map(lambda x: date_to_timestamp(x))
@@ -158,3 +179,387 @@ def aggregate_activity_by_hour(trans_df : pd.DataFrame, window_len)-> pd.DataFra
     window_aggs_df = window_aggs_df.merge(trans_df[["cc_num", "datetime", "month"]].sort_index(),left_index=True, right_index=True)
  
     return window_aggs_df
+
+
+MILLISECONDS_PER_DAY = 86400 * 1000
+
+
+def pair_lag_features(event: dict, prev_datetime: int, prev_longitude: float, prev_latitude: float)-> dict:
+    """Lag features of the transaction `event` against the previous transaction of the same card, as
+       `activity_level` computes them for a pair of consecutive transactions (coordinates in degrees,
+       datetimes as timestamps in ms).
+    """
+    # `activity_level` converts the coordinates to radians before calling `haversine_distance`.
+    loc_delta = haversine_distance(radians(event["longitude"]), radians(event["latitude"]),
+                                   radians(prev_longitude), radians(prev_latitude))
+    # Same argument order as `activity_level`: the later transaction minus the earlier one.
+    days_delta = time_delta(int(event["datetime"]), int(prev_datetime)) / MILLISECONDS_PER_DAY
+    return {"loc_delta_t_minus_1": float(loc_delta), "time_delta_t_minus_1": days_delta}
+
+
+def pair_lag_features_batch(datetimes : np.ndarray, longitudes : np.ndarray, latitudes : np.ndarray, prev_datetimes : np.ndarray,
+                            prev_longitudes : np.ndarray, prev_latitudes : np.ndarray)-> dict:
+    """Vectorized `pair_lag_features`, over arrays of transactions and the previous transactions of their cards."""
+    def to_radians(x):
+        # Converted twice, as `activity_level` converts the coordinates before `haversine_distance` converts them again.
+        return np.radians(np.radians(np.asarray(x, dtype=np.float64)))
+
+    loc_delta = _haversine(to_radians(longitudes), to_radians(latitudes), to_radians(prev_longitudes), to_radians(prev_latitudes))
+    days_delta = time_delta(np.asarray(datetimes, dtype=np.int64), np.asarray(prev_datetimes, dtype=np.int64)) / MILLISECONDS_PER_DAY
+    return {"loc_delta_t_minus_1": loc_delta, "time_delta_t_minus_1": days_delta}
+
+
+class StreamingFeatureEngine:
+    """Online counterpart of `activity_level`: keeps the last transaction of every card in flat NumPy arrays
+       (one slot per cc_num) and computes the lag features of an incoming transaction from it, using the same
+       formulas as the batch path. Events are dicts (or rows) with "cc_num", "datetime" (a timestamp in ms,
+       as stored in the feature groups), "longitude" and "latitude" (in degrees, as in the raw transactions).
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._slots = {}
+        self._datetime = np.zeros(capacity, dtype=np.int64)
+        self._longitude = np.zeros(capacity, dtype=np.float64)
+        self._latitude = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self)-> int:
+        return len(self._slots)
+
+    def __contains__(self, cc_num: int)-> bool:
+        return int(cc_num) in self._slots
+
+    def _new_slot(self, cc_num: int)-> int:
+        slot = len(self._slots)
+        if slot == len(self._datetime):
+            capacity = max(2 * slot, 1)
+            self._datetime = np.resize(self._datetime, capacity)
+            self._longitude = np.resize(self._longitude, capacity)
+            self._latitude = np.resize(self._latitude, capacity)
+        self._slots[cc_num] = slot
+        return slot
+
+    def lag_features(self, event: dict)-> dict:
+        """Return the lag features of `event` against the last recorded transaction of its card, without
+           recording it. As in `activity_level`, a card without a previous transaction gets 0 for both.
+        """
+        slot = self._slots.get(int(event["cc_num"]))
+        if slot is None:
+            return {"loc_delta_t_minus_1": 0.0, "time_delta_t_minus_1": 0.0}
+        return pair_lag_features(event, self._datetime[slot], self._longitude[slot], self._latitude[slot])
+
+    def record(self, event: dict):
+        """Record `event` as the last transaction of its card, unless the card already has a later one."""
+        cc_num = int(event["cc_num"])
+        slot = self._slots.get(cc_num)
+        if slot is None:
+            slot = self._new_slot(cc_num)
+        elif int(event["datetime"]) < self._datetime[slot]:
+            return
+        self._datetime[slot] = int(event["datetime"])
+        self._longitude[slot] = event["longitude"]
+        self._latitude[slot] = event["latitude"]
+
+    def update(self, event: dict)-> dict:
+        """Return the lag features of `event` and record it as the last transaction of its card."""
+        features = self.lag_features(event)
+        self.record(event)
+        return features
+
+    def to_frame(self)-> pd.DataFrame:
+        n = len(self._slots)
+        return pd.DataFrame({
+            "datetime": self._datetime[:n],
+            "cc_num": np.fromiter(self._slots.keys(), dtype=np.int64, count=n),
+            "latitude": self._latitude[:n],
+            "longitude": self._longitude[:n],
+        })
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame)-> "StreamingFeatureEngine":
+        """Build the state from transactions with the columns of `latest_recorded_transactions_fraud_online`,
+           e.g. the `previous_transaction_coordinates` of the backfill, keeping the last transaction per card.
+        """
+        df = df.sort_values("datetime", kind="mergesort").drop_duplicates("cc_num", keep="last")
+        datetimes = df["datetime"]
+        if not pd.api.types.is_integer_dtype(datetimes):
+            datetimes = datetimes.map(lambda x: date_to_timestamp(x))
+        engine = cls(capacity=max(len(df), 1))
+        engine._slots = {int(cc_num): slot for slot, cc_num in enumerate(df["cc_num"])}
+        engine._datetime[:len(df)] = datetimes.to_numpy()
+        engine._longitude[:len(df)] = df["longitude"].to_numpy()
+        engine._latitude[:len(df)] = df["latitude"].to_numpy()
+        return engine
+
+    def snapshot(self, path: str):
+        """Save the state to a `.npz` file, to warm start another engine with `StreamingFeatureEngine.load`."""
+        state = self.to_frame()
+        np.savez(path, **{column: state[column].to_numpy() for column in state.columns})
+
+    @classmethod
+    def load(cls, path: str)-> "StreamingFeatureEngine":
+        with np.load(path) as state:
+            return cls.from_frame(pd.DataFrame({column: state[column] for column in state.files}))
+
+
+# Lengths that `card_owner_age` and `expiry_days` divide by (`np.timedelta64(1, "Y")` is 365.2425 days), in ns.
+NANOSECONDS_PER_YEAR = 31556952 * 10**9
+NANOSECONDS_PER_DAY = 86400 * 10**9
+
+
+def _to_timestamps(values)-> np.ndarray:
+    """Timestamps in ms of datetimes, or of timestamps in ms."""
+    values = pd.Series(values)
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+    return (pd.to_datetime(values).to_numpy(dtype="datetime64[ms]")).astype(np.int64)
+
+
+def card_expiry_from_transactions(trans_df : pd.DataFrame)-> pd.DataFrame:
+    """Expiry date (ms timestamp) of every card, recovered from `datetime` and `days_until_card_expires` of its
+       transactions, e.g. of `transactions_fraud_online`, where the credit cards themselves are not stored.
+    """
+    trans_df = trans_df.drop_duplicates("cc_num")
+    expires = _to_timestamps(trans_df["datetime"]) + np.round(trans_df["days_until_card_expires"].to_numpy() * MILLISECONDS_PER_DAY)
+    return pd.DataFrame({"cc_num": trans_df["cc_num"].to_numpy(), "expires": expires.astype(np.int64)})
+
+
+class CardStaticFeatures:
+    """Per-card table of what the time dependent card features are computed from: birthdate and card expiry
+       (timestamps in ms) and sex (as a code into `sex_categories`), in arrays sorted by cc_num. `features` computes
+       `age_at_transaction`, `days_until_card_expires` and `sex` at request time as `card_owner_age` and
+       `expiry_days` do, so that they need not be looked up with the feature vector.
+    """
+
+    def __init__(self, cc_nums : np.ndarray, birthdates : np.ndarray, expires : np.ndarray, sex_codes : np.ndarray,
+                 sex_categories: Iterable[str]):
+        self.cc_nums = np.asarray(cc_nums, dtype=np.int64)
+        self.birthdates = np.asarray(birthdates, dtype=np.int64)
+        self.expires = np.asarray(expires, dtype=np.int64)
+        self.sex_codes = np.asarray(sex_codes, dtype=np.int8)
+        # Arrays that are already sorted (e.g. attached from a snapshot) are used as they are, without copies.
+        if np.any(self.cc_nums[1:] < self.cc_nums[:-1]):
+            order = np.argsort(self.cc_nums, kind="mergesort")
+            self.cc_nums = self.cc_nums[order]
+            self.birthdates = self.birthdates[order]
+            self.expires = self.expires[order]
+            self.sex_codes = self.sex_codes[order]
+        self.sex_categories = np.asarray(list(sex_categories), dtype=object)
+
+    def __len__(self)-> int:
+        return len(self.cc_nums)
+
+    def __contains__(self, cc_num: int)-> bool:
+        slot = np.searchsorted(self.cc_nums, cc_num)
+        return slot < len(self.cc_nums) and self.cc_nums[slot] == cc_num
+
+    def _slots(self, cc_nums : np.ndarray)-> np.ndarray:
+        slots = np.searchsorted(self.cc_nums, cc_nums)
+        found = slots < len(self.cc_nums)
+        found[found] = self.cc_nums[slots[found]] == cc_nums[found]
+        if not found.all():
+            raise KeyError(f"Unknown cards {cc_nums[~found][:5].tolist()}")
+        return slots
+
+    @classmethod
+    def from_frames(cls, profiles_df : pd.DataFrame, credit_cards_df : pd.DataFrame)-> "CardStaticFeatures":
+        """Build the table from the profiles (`birthdate`, `sex`) and credit cards (`expires`, as "%m/%y" strings
+           like the generated cards, or as datetimes or ms timestamps like `card_expiry_from_transactions`).
+        """
+        cards_df = profiles_df[["cc_num", "birthdate", "sex"]].drop_duplicates("cc_num", keep="last")\
+            .merge(credit_cards_df[["cc_num", "expires"]].drop_duplicates("cc_num", keep="last"), on="cc_num")
+        expires = cards_df["expires"]
+        if pd.api.types.is_object_dtype(expires):
+            expires = pd.to_datetime(expires, format="%m/%y")
+        sex = pd.Categorical(cards_df["sex"])
+        return cls(cards_df["cc_num"].to_numpy(), _to_timestamps(cards_df["birthdate"]), _to_timestamps(expires),
+                   sex.codes, sex.categories)
+
+    def features(self, cc_num: int, current_datetime: int)-> dict:
+        """`age_at_transaction`, `days_until_card_expires` and `sex` of a transaction at `current_datetime` (in ms)."""
+        features = self.features_batch(np.array([cc_num]), np.array([current_datetime]))
+        return {name: values[0].item() if hasattr(values[0], "item") else values[0] for name, values in features.items()}
+
+    def features_batch(self, cc_nums, datetimes)-> dict:
+        """Vectorized `features`, over arrays of cc_num and datetime (in ms)."""
+        slots = self._slots(np.asarray(cc_nums, dtype=np.int64))
+        datetimes = np.asarray(datetimes, dtype=np.int64)
+        # Same as dividing the differences of datetime64[ns] values by the lengths of a year and a day.
+        age = ((datetimes - self.birthdates[slots]) * 10**6).astype(np.float64) / NANOSECONDS_PER_YEAR
+        days = ((self.expires[slots] - datetimes) * 10**6).astype(np.float64) / NANOSECONDS_PER_DAY
+        return {"age_at_transaction": age, "days_until_card_expires": days,
+                "sex": self.sex_categories[self.sex_codes[slots]]}
+
+    def snapshot(self, path: str):
+        np.savez(path, cc_nums=self.cc_nums, birthdates=self.birthdates, expires=self.expires, sex_codes=self.sex_codes,
+                 sex_categories=self.sex_categories.astype(str))
+
+    @classmethod
+    def load(cls, path: str, shared: bool = False)-> "CardStaticFeatures":
+        """Load a snapshot. With `shared`, its arrays are attached read-only with `attach_npz`, so that the
+           processes of a host loading the same snapshot share one copy.
+        """
+        if shared:
+            state = shared_arrays.attach_npz(path)
+            return cls(state["cc_nums"], state["birthdates"], state["expires"], state["sex_codes"], state["sex_categories"])
+        with np.load(path) as state:
+            return cls(state["cc_nums"], state["birthdates"], state["expires"], state["sex_codes"], state["sex_categories"])
+
+
+class CardHistory:
+    """Online counterpart of `activity_level` with several lags: keeps the last `depth` transactions of every card
+       in ring buffers, rows of preallocated (cards x depth) NumPy blocks, and computes the lag features of an
+       incoming transaction against each of them, and counts and amounts of the card's transactions in short
+       windows before it. Each event takes O(depth) and writes in place; only a new card can grow the blocks.
+       Events are dicts (or rows) with "cc_num", "datetime" (ms), "longitude", "latitude" (degrees) and "amount".
+    """
+
+    def __init__(self, depth: int = 4, capacity: int = 1024):
+        self.depth = depth
+        self._slots = {}
+        self._datetime = np.zeros((capacity, depth), dtype=np.int64)
+        self._longitude = np.zeros((capacity, depth), dtype=np.float64)
+        self._latitude = np.zeros((capacity, depth), dtype=np.float64)
+        self._amount = np.zeros((capacity, depth), dtype=np.float64)
+        # position of the next write in the ring of each card, and how many of its positions are filled
+        self._head = np.zeros(capacity, dtype=np.int64)
+        self._size = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self)-> int:
+        return len(self._slots)
+
+    def __contains__(self, cc_num: int)-> bool:
+        return int(cc_num) in self._slots
+
+    def _new_slot(self, cc_num: int)-> int:
+        slot = len(self._slots)
+        if slot == len(self._head):
+            capacity = max(2 * slot, 1)
+            for name in ["_datetime", "_longitude", "_latitude", "_amount"]:
+                block = getattr(self, name)
+                grown = np.zeros((capacity, self.depth), dtype=block.dtype)
+                grown[:slot] = block
+                setattr(self, name, grown)
+            self._head = np.resize(self._head, capacity)
+            self._size = np.resize(self._size, capacity)
+        self._head[slot] = 0
+        self._size[slot] = 0
+        self._slots[cc_num] = slot
+        return slot
+
+    def lag_features(self, event: dict, lags: Iterable[int] = None, windows: dict = None)-> dict:
+        """Return `loc_delta_t_minus_{k}` and `time_delta_t_minus_{k}` of `event` against the k-th previous
+           transaction of its card, for each k in `lags` (by default 1 to `depth`; 0 for both without one, as in
+           `activity_level`), and for each `name: milliseconds` in `windows`, `trans_count_{name}` and
+           `trans_amount_{name}` of the card's transactions in that long before `event`. Nothing is recorded.
+        """
+        lags = range(1, self.depth + 1) if lags is None else lags
+        windows = windows or {}
+        features = {}
+        slot = self._slots.get(int(event["cc_num"]))
+        size = 0 if slot is None else int(self._size[slot])
+        for lag in lags:
+            if lag > self.depth:
+                raise ValueError(f"lag {lag} is deeper than the history ({self.depth})")
+            if lag > size:
+                features[f"loc_delta_t_minus_{lag}"] = 0.0
+                features[f"time_delta_t_minus_{lag}"] = 0.0
+                continue
+            i = (self._head[slot] - lag) % self.depth
+            pair = pair_lag_features(event, self._datetime[slot, i], self._longitude[slot, i], self._latitude[slot, i])
+            features[f"loc_delta_t_minus_{lag}"] = pair["loc_delta_t_minus_1"]
+            features[f"time_delta_t_minus_{lag}"] = pair["time_delta_t_minus_1"]
+        current_datetime = int(event["datetime"])
+        for name, window in windows.items():
+            count, amount = 0, 0.0
+            for lag in range(1, size + 1):
+                i = (self._head[slot] - lag) % self.depth
+                # the ring is in time order, newest first from the head
+                if current_datetime - self._datetime[slot, i] > window:
+                    break
+                count += 1
+                amount += self._amount[slot, i]
+            features[f"trans_count_{name}"] = count
+            features[f"trans_amount_{name}"] = amount
+        return features
+
+    def record(self, event: dict):
+        """Record `event` as the latest transaction of its card, unless the card already has a later one."""
+        cc_num = int(event["cc_num"])
+        slot = self._slots.get(cc_num)
+        if slot is None:
+            slot = self._new_slot(cc_num)
+        elif self._size[slot] and int(event["datetime"]) < self._datetime[slot, (self._head[slot] - 1) % self.depth]:
+            return
+        i = self._head[slot]
+        self._datetime[slot, i] = int(event["datetime"])
+        self._longitude[slot, i] = event["longitude"]
+        self._latitude[slot, i] = event["latitude"]
+        self._amount[slot, i] = event["amount"]
+        self._head[slot] = (i + 1) % self.depth
+        self._size[slot] = min(self._size[slot] + 1, self.depth)
+
+    def update(self, event: dict, lags: Iterable[int] = None, windows: dict = None)-> dict:
+        """Return the features of `event` (see `lag_features`) and record it."""
+        features = self.lag_features(event, lags, windows)
+        self.record(event)
+        return features
+
+    def cards(self)-> np.ndarray:
+        return np.fromiter(self._slots, dtype=np.int64, count=len(self._slots))
+
+    def export_cards(self, cc_nums: Iterable[int], remove: bool = False)-> Dict[str, np.ndarray]:
+        """Return the rings of the cards in `cc_nums` that have a history, as arrays that `import_cards` takes,
+           e.g. to hand them to another process. With `remove`, forget them here, moving the remaining cards down so the
+           blocks stay dense.
+        """
+        cc_nums = [int(cc_num) for cc_num in cc_nums if int(cc_num) in self._slots]
+        slots = np.asarray([self._slots[cc_num] for cc_num in cc_nums], dtype=np.int64)
+        state = {"cc_num": np.asarray(cc_nums, dtype=np.int64)}
+        for name in ["datetime", "longitude", "latitude", "amount", "head", "size"]:
+            state[name] = getattr(self, "_" + name)[slots].copy()
+        if remove and cc_nums:
+            for cc_num in cc_nums:
+                del self._slots[cc_num]
+            kept = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            for name in ["_datetime", "_longitude", "_latitude", "_amount", "_head", "_size"]:
+                block = getattr(self, name)
+                block[:len(kept)] = block[kept]
+            self._slots = {cc_num: slot for slot, cc_num in enumerate(self._slots)}
+        return state
+
+    def import_cards(self, state: Dict[str, np.ndarray]):
+        """Take over the rings exported by `export_cards` of another history with the same depth, replacing the
+           ones of the same cards here.
+        """
+        if len(state["cc_num"]) and state["datetime"].shape[1] != self.depth:
+            raise ValueError(f"Histories of depth {state['datetime'].shape[1]} can't be imported at depth {self.depth}")
+        for i, cc_num in enumerate(state["cc_num"].tolist()):
+            slot = self._slots.get(cc_num)
+            if slot is None:
+                slot = self._new_slot(cc_num)
+            for name in ["datetime", "longitude", "latitude", "amount", "head", "size"]:
+                getattr(self, "_" + name)[slot] = state[name][i]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, depth: int = 4)-> "CardHistory":
+        """Build the history from transactions, e.g. those of `transactions_fraud_online`, keeping the last
+           `depth` transactions of every card.
+        """
+        df = df.sort_values(["cc_num", "datetime"], kind="mergesort").groupby("cc_num").tail(depth)
+        datetimes = df["datetime"]
+        if not pd.api.types.is_integer_dtype(datetimes):
+            datetimes = datetimes.map(lambda x: date_to_timestamp(x))
+        cc_nums = df["cc_num"].to_numpy()
+        cards, first, counts = np.unique(cc_nums, return_index=True, return_counts=True)
+        history = cls(depth=depth, capacity=max(len(cards), 1))
+        history._slots = {int(cc_num): slot for slot, cc_num in enumerate(cards)}
+        slots = np.repeat(np.arange(len(cards)), counts)
+        # oldest first, from position 0 of each ring
+        positions = np.arange(len(df)) - np.repeat(first, counts)
+        history._datetime[slots, positions] = datetimes.to_numpy()
+        history._longitude[slots, positions] = df["longitude"].to_numpy()
+        history._latitude[slots, positions] = df["latitude"].to_numpy()
+        history._amount[slots, positions] = df["amount"].to_numpy()
+        history._size[:len(cards)] = counts
+        history._head[:len(cards)] = counts % depth
+        return history
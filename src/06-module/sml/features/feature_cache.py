@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pandas as pd
+
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class InMemoryBackend:
+    """Size-bounded store of cache entries, evicting the least recently used entry when full. Safe to share
+       between threads, e.g. the lookup threads of `online_features` and the flush thread of a `WriteBehindBuffer`.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self)-> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def keys(self)-> List[Hashable]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _plain(value):
+    # NumPy scalars (e.g. a cc_num read from a DataFrame) hash like Python scalars, but keep keys uniform.
+    return value.item() if hasattr(value, "item") else value
+
+
+class FeatureVectorCache:
+    """Cache of online feature vectors keyed by (feature view name, version, primary key).
+
+       `ttls` maps feature view names to the number of seconds their vectors stay valid (None never expires,
+       0 disables caching), falling back to `default_ttl`. Writers invalidate what they change, e.g. the insert
+       in `latest_recorded_transactions_fraud_online` calls `invalidate_rows` for the cards it updates.
+       The backend is any object with the `get`/`set`/`delete`/`keys` methods of `InMemoryBackend`, safe to call
+       from several threads.
+    """
+
+    def __init__(self, backend=None, ttls: Optional[Dict[str, Optional[float]]] = None, default_ttl: Optional[float] = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.backend = backend if backend is not None else InMemoryBackend()
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str, version: int, entry: dict)-> Tuple:
+        return (name, version, tuple(sorted((column, _plain(value)) for column, value in entry.items())))
+
+    def get(self, name: str, version: int, entry: dict):
+        """Return the cached vector, or None if it is missing or expired."""
+        key = self.key(name, version, entry)
+        cached = self.backend.get(key)
+        if cached is not None:
+            expires_at, vector = cached
+            if expires_at is None or expires_at > self.clock():
+                with self._lock:
+                    self.hits += 1
+                return vector
+            self.backend.delete(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, name: str, version: int, entry: dict, vector):
+        ttl = self.ttls.get(name, self.default_ttl)
+        if ttl == 0:
+            return
+        self.backend.set(self.key(name, version, entry), (None if ttl is None else self.clock() + ttl, vector))
+
+    def get_feature_vector(self, feature_view, entry: dict):
+        """Cached `feature_view.get_feature_vector(entry)`. Lookups with `passed_features` are not cached,
+           because the feature view applies its transformation functions to the passed values: set them in the
+           cached vector with `online_features.apply_passed_features` and `feature_view_transformations`.
+        """
+        vector = self.get(feature_view.name, feature_view.version, entry)
+        if vector is None:
+            vector = feature_view.get_feature_vector(entry)
+            self.put(feature_view.name, feature_view.version, entry, vector)
+        return vector
+
+    def invalidate(self, name: str, version: int, entry: dict):
+        self.backend.delete(self.key(name, version, entry))
+
+    def invalidate_feature_view(self, name: str, version: Optional[int] = None):
+        for key in self.backend.keys():
+            if key[0] == name and (version is None or key[1] == version):
+                self.backend.delete(key)
+
+    def invalidate_rows(self, df : pd.DataFrame, feature_views: Iterable[Tuple[str, int]], primary_key: Iterable[str] = ("cc_num",)):
+        """Invalidation hook for feature group inserts: drop the vectors of every row of `df` (by `primary_key`)
+           in each of the `(name, version)` feature views that read from the feature group.
+        """
+        primary_key = list(primary_key)
+        entries = df[primary_key].drop_duplicates().to_dict("records")
+        for name, version in feature_views:
+            for entry in entries:
+                self.invalidate(name, version, entry)
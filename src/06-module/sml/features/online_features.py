@@ -0,0 +1,244 @@
+import asyncio
+import operator
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from sml import latency
+from sml.features import cc_features
+
+# Remote lookups are I/O bound, so a few threads are enough to overlap them.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="feature-lookup")
+
+
+def serving_feature_names(feature_view)-> List[str]:
+    """Names of the features in the vectors returned by `feature_view.get_feature_vector`, in order."""
+    return [feature.name for feature in feature_view.schema if not feature.label]
+
+
+def model_input_names(model_schema)-> List[str]:
+    """Names of the model inputs, from a `ModelSchema`, its `to_dict()` (what `model.model_schema` holds once the
+       model is in the registry) or a list of names.
+    """
+    if hasattr(model_schema, "to_dict"):
+        model_schema = model_schema.to_dict()
+    if isinstance(model_schema, dict):
+        return [column["name"] for column in model_schema["input_schema"]["columnar_schema"]]
+    return list(model_schema)
+
+
+class FeatureVectorLayout:
+    """Where each model input is in the feature vectors of a feature view, compiled once so that requests copy the
+       model inputs into a preallocated row (or batch) by position, instead of dropping fields by index.
+
+       `fill` and `fill_batch` reuse their buffers between calls, so copy the result if you keep it.
+    """
+
+    def __init__(self, feature_names: List[str], model_feature_names: Optional[List[str]] = None):
+        self.feature_names = list(feature_names)
+        # By default all features except cc_num and datetime, which the model was not trained on.
+        if model_feature_names is None:
+            model_feature_names = [name for name in self.feature_names if name not in ("cc_num", "datetime")]
+        self.model_feature_names = list(model_feature_names)
+        missing = [name for name in self.model_feature_names if name not in self.feature_names]
+        if missing:
+            raise ValueError(f"Model inputs {missing} are not in the feature vector {self.feature_names}")
+        self.columns = {name: i for i, name in enumerate(self.model_feature_names)}
+        self.positions = np.array([self.feature_names.index(name) for name in self.model_feature_names], dtype=np.intp)
+        self._getter = operator.itemgetter(*self.positions.tolist())
+        self._row = np.empty(len(self.positions), dtype=np.float64)
+        self._batch = np.empty((0, len(self.positions)), dtype=np.float64)
+
+    @classmethod
+    def compile(cls, feature_view, model_schema=None):
+        """Layout of the vectors of `feature_view` for a model with `model_schema`."""
+        return cls(serving_feature_names(feature_view), None if model_schema is None else model_input_names(model_schema))
+
+    def __len__(self)-> int:
+        return len(self.positions)
+
+    def fill(self, feature_vector, out: Optional[np.ndarray] = None)-> np.ndarray:
+        """Copy the model inputs of one feature vector into `out`, by default the layout's own row."""
+        out = self._row if out is None else out
+        # itemgetter of a single position returns the value instead of a tuple
+        out[:] = self._getter(feature_vector) if len(self.positions) > 1 else [self._getter(feature_vector)]
+        return out
+
+    def fill_batch(self, feature_vectors, out: Optional[np.ndarray] = None)-> np.ndarray:
+        """Copy the model inputs of many feature vectors (a list of vectors or a 2-D array) into the rows of `out`,
+           by default the layout's own batch, which grows to the largest batch seen.
+        """
+        n = len(feature_vectors)
+        if out is None:
+            if len(self._batch) < n:
+                self._batch = np.empty((n, len(self.positions)), dtype=np.float64)
+            out = self._batch[:n]
+        if isinstance(feature_vectors, np.ndarray):
+            out[:] = feature_vectors[:, self.positions]
+        else:
+            for i, feature_vector in enumerate(feature_vectors):
+                self.fill(feature_vector, out[i])
+        return out
+
+    def set(self, row : np.ndarray, name: str, value):
+        """Set a model input of a filled row (or a column of a filled batch) by name."""
+        row[..., self.columns[name]] = value
+
+
+def feature_view_transformations(feature_view)-> Dict[str, Callable]:
+    """Transformation function of each transformed feature of `feature_view` (feature name -> function), the ones
+       `get_feature_vector` applies to passed features. Call `feature_view.init_serving(...)` first, so that the
+       built-in functions such as `min_max_scaler` have the statistics of the training dataset.
+    """
+    transformation_functions = getattr(feature_view, "transformation_functions", None) or {}
+    return {name: function.transformation_fn for name, function in transformation_functions.items()}
+
+
+def apply_passed_features(feature_vector : list, feature_names : List[str], passed_features : dict,
+                          transformations: Optional[Dict[str, Callable]] = None)-> list:
+    """Overwrite the features in `passed_features` by name, as `get_feature_vector(..., passed_features=...)` does.
+       The feature view applies its transformation functions to passed features, so pass the same ones in
+       `transformations` (feature name -> function, see `feature_view_transformations`) for the features it
+       transforms.
+    """
+    transformations = transformations or {}
+    positions = {name: i for i, name in enumerate(feature_names)}
+    vector = list(feature_vector)
+    for name, value in passed_features.items():
+        if name in positions:
+            transformation = transformations.get(name)
+            vector[positions[name]] = transformation(value) if transformation is not None else value
+    return vector
+
+
+def _lag_features(latest_record_vector : list, cc_num: int, current_datetime: int, long: float, lat: float)-> dict:
+    current = {"datetime": current_datetime, "cc_num": cc_num, "longitude": long, "latitude": lat}
+    if latest_record_vector is None:
+        return {"loc_delta_t_minus_1": 0.0, "time_delta_t_minus_1": 0.0}
+    # `latest_recorded_transactions_fraud_online_fv` returns [datetime, cc_num, latitude, longitude].
+    return cc_features.pair_lag_features(current, latest_record_vector[0], latest_record_vector[3], latest_record_vector[2])
+
+
+def _get_feature_vector(feature_view, entry: dict):
+    return feature_view.get_feature_vector(entry)
+
+
+def _submit_lookups(fv, latest_record_fv, cc_num: int, executor: Optional[Executor], lookup: Optional[Callable]):
+    executor = executor or _executor
+    lookup = lookup or _get_feature_vector
+    entry = {"cc_num": cc_num}
+    return executor.submit(lookup, latest_record_fv, entry), executor.submit(lookup, fv, entry)
+
+
+def _assemble(fv, feature_vector : list, lag_features : dict, feature_names: Optional[List[str]],
+              passed_features: Optional[dict], transformations: Optional[Dict[str, Callable]])-> list:
+    feature_names = feature_names or serving_feature_names(fv)
+    transformations = feature_view_transformations(fv) if transformations is None else transformations
+    return apply_passed_features(feature_vector, feature_names, {**(passed_features or {}), **lag_features}, transformations)
+
+
+async def get_feature_vector_async(fv, latest_record_fv, cc_num: int, current_datetime: int, long: float, lat: float,
+                                   feature_names: Optional[List[str]] = None, passed_features: Optional[dict] = None,
+                                   transformations: Optional[Dict[str, Callable]] = None,
+                                   executor: Optional[Executor] = None, lookup: Optional[Callable] = None)-> list:
+    """Assemble the online feature vector of a transaction, issuing the lookups in `latest_record_fv` and `fv`
+       concurrently instead of one after the other. The lag features are computed as soon as the latest recorded
+       transaction arrives, and set in the vector from `fv` (with `passed_features`) by `apply_passed_features`,
+       through the transformation functions of `fv` unless `transformations` is given.
+
+       The vectors are fetched with `lookup(feature_view, entry)`, by default `feature_view.get_feature_vector(entry)`,
+       e.g. `FeatureVectorCache.get_feature_vector` to serve them from a cache.
+    """
+    latest_record_future, feature_vector_future = _submit_lookups(fv, latest_record_fv, cc_num, executor, lookup)
+    lag_features = _lag_features(await asyncio.wrap_future(latest_record_future), cc_num, current_datetime, long, lat)
+    feature_vector = await asyncio.wrap_future(feature_vector_future)
+    return _assemble(fv, feature_vector, lag_features, feature_names, passed_features, transformations)
+
+
+def get_feature_vector_concurrent(fv, latest_record_fv, cc_num: int, current_datetime: int, long: float, lat: float,
+                                  feature_names: Optional[List[str]] = None, passed_features: Optional[dict] = None,
+                                  transformations: Optional[Dict[str, Callable]] = None,
+                                  executor: Optional[Executor] = None, lookup: Optional[Callable] = None)-> list:
+    """Blocking `get_feature_vector_async`, for callers without an event loop (e.g. Streamlit)."""
+    latest_record_future, feature_vector_future = _submit_lookups(fv, latest_record_fv, cc_num, executor, lookup)
+    lag_features = _lag_features(latest_record_future.result(), cc_num, current_datetime, long, lat)
+    return _assemble(fv, feature_vector_future.result(), lag_features, feature_names, passed_features, transformations)
+
+
+def get_feature_matrix(fv, latest_record_fv, cc_nums, datetimes, amounts, longs, lats,
+                       feature_names: Optional[List[str]] = None,
+                       transformations: Optional[Dict[str, Callable]] = None)-> Tuple[np.ndarray, List[str]]:
+    """Feature vectors of many transactions (arrays of cc_num, datetime in ms, amount, longitude and latitude).
+
+       The feature vectors and latest recorded transactions of all distinct cards are fetched with one
+       `get_feature_vectors` call per feature view, and the lag features are computed for all transactions at once.
+       When a card has several transactions in the request, each one is compared with the one before it.
+       `amount` and the lag features are set by name as passed features (see `apply_passed_features`), through the
+       transformation functions of `fv` unless `transformations` is given.
+       Returns the (transactions x features) matrix and the names of its columns. Raises `KeyError` with the cards
+       that `fv` has no feature vector for.
+    """
+    cc_nums = np.asarray(cc_nums, dtype=np.int64)
+    datetimes = np.asarray(datetimes, dtype=np.int64)
+    longs = np.asarray(longs, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    cards, card_index = np.unique(cc_nums, return_inverse=True)
+    entries = [{"cc_num": int(cc_num)} for cc_num in cards]
+
+    latest_record_future = _executor.submit(latest_record_fv.get_feature_vectors, entries)
+    feature_vectors_future = _executor.submit(fv.get_feature_vectors, entries)
+    # `latest_recorded_transactions_fraud_online_fv` returns [datetime, cc_num, latitude, longitude].
+    with latency.recorder.timer("bulk_latest_record_lookup"):
+        latest_record_vectors = latest_record_future.result()
+    latest_records = np.array([vector if vector is not None else [np.nan] * 4 for vector in latest_record_vectors],
+                              dtype=np.float64)
+    prev_datetimes = latest_records[card_index, 0]
+    prev_longs = latest_records[card_index, 3]
+    prev_lats = latest_records[card_index, 2]
+
+    # Transactions of the same card in this request follow each other.
+    order = np.lexsort((datetimes, cc_nums))
+    follows = np.flatnonzero(cc_nums[order][1:] == cc_nums[order][:-1]) + 1
+    prev_datetimes[order[follows]] = datetimes[order[follows - 1]]
+    prev_longs[order[follows]] = longs[order[follows - 1]]
+    prev_lats[order[follows]] = lats[order[follows - 1]]
+
+    has_prev = ~np.isnan(prev_datetimes)
+    lag_features = {name: np.zeros(len(cc_nums)) for name in ["loc_delta_t_minus_1", "time_delta_t_minus_1"]}
+    if has_prev.any():
+        with latency.recorder.timer("bulk_lag_features"):
+            pairs = cc_features.pair_lag_features_batch(datetimes[has_prev], longs[has_prev], lats[has_prev],
+                                                        prev_datetimes[has_prev], prev_longs[has_prev], prev_lats[has_prev])
+        for name, values in pairs.items():
+            lag_features[name][has_prev] = values
+
+    feature_names = feature_names or serving_feature_names(fv)
+    with latency.recorder.timer("bulk_feature_vectors"):
+        feature_vectors = feature_vectors_future.result()
+    missing = [int(cc_num) for cc_num, vector in zip(cards, feature_vectors) if vector is None]
+    if missing:
+        raise KeyError(f"No feature vector for cards {missing}")
+    matrix = np.array(feature_vectors, dtype=object)[card_index]
+    transformations = feature_view_transformations(fv) if transformations is None else transformations
+    for name, values in {"amount": np.asarray(amounts, dtype=np.float64), **lag_features}.items():
+        if name in feature_names:
+            transformation = transformations.get(name)
+            matrix[:, feature_names.index(name)] = transformation(values) if transformation is not None else values
+    return matrix, feature_names
+
+
+def score_bulk(predict : Callable, fv, latest_record_fv, cc_nums, datetimes, amounts, longs, lats,
+               feature_names: Optional[List[str]] = None, layout: Optional[FeatureVectorLayout] = None,
+               transformations: Optional[Dict[str, Callable]] = None)-> np.ndarray:
+    """Score many transactions with one call of `predict` on the (transactions x model inputs) matrix,
+       e.g. `model.predict` or `lambda X: deployment.predict({"inputs": X.tolist()})["predictions"]`.
+       `layout` selects the model inputs, by default all features except cc_num and datetime. Predictions are in input order.
+    """
+    matrix, feature_names = get_feature_matrix(fv, latest_record_fv, cc_nums, datetimes, amounts, longs, lats,
+                                               feature_names, transformations)
+    layout = layout if layout is not None else FeatureVectorLayout(feature_names)
+    batch = layout.fill_batch(matrix)
+    with latency.recorder.timer("bulk_predict"):
+        return np.asarray(predict(batch))
@@ -0,0 +1,109 @@
+import os
+
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+from sml.features import cc_features
+
+
+def shard_by_cc_num(trans_df : pd.DataFrame, n_shards: int)-> List[np.ndarray]:
+    """Split the row positions of `trans_df` into `n_shards` groups by a hash of `cc_num`.
+       All transactions of a card land in the same shard, and the assignment is stable across processes and runs.
+    """
+    shard_ids = pd.util.hash_array(trans_df["cc_num"].to_numpy()) % n_shards
+    return [np.flatnonzero(shard_ids == shard_id) for shard_id in range(n_shards)]
+
+
+def _write_stream(sink, table : pa.Table):
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    sink.close()
+
+
+def _write_shared_frame(df : pd.DataFrame)-> Tuple[str, int]:
+    """Write `df` as an Arrow IPC stream into a new shared memory block and return its name and size."""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    # Size the stream first, so it can be written straight into the shared memory block.
+    mock_sink = pa.MockOutputStream()
+    _write_stream(mock_sink, table)
+    size = mock_sink.size()
+
+    shm = SharedMemory(create=True, size=size)
+    try:
+        _write_stream(pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), table)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return shm.name, size
+
+
+def _read_shared_frame(name: str, size: int, unlink: bool = False)-> pd.DataFrame:
+    shm = SharedMemory(name=name)
+    try:
+        with pa.ipc.open_stream(pa.py_buffer(shm.buf[:size])) as reader:
+            df = reader.read_pandas()
+        # `read_pandas` copies the columns out of the Arrow buffers, so the block can be closed here.
+        del reader
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    return df
+
+
+def _unlink_shared(name: str):
+    shm = SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+
+def _run_shard(func : Callable, name: str, size: int, args: tuple)-> Tuple[str, int]:
+    shard_df = _read_shared_frame(name, size)
+    return _write_shared_frame(func(shard_df, *args))
+
+
+def map_shards(trans_df : pd.DataFrame, func : Callable, *args, n_workers: Optional[int] = None)-> pd.DataFrame:
+    """Run `func(shard_df, *args)` on each `cc_num` shard of `trans_df` in a process pool.
+
+       `func` must be a per-card computation (such as `cc_features.activity_level`) defined at module level.
+       Shards are handed to the workers, and results handed back, as Arrow IPC streams in shared memory,
+       and the results are concatenated in shard order.
+    """
+    n_workers = n_workers or os.cpu_count()
+    # blocks are unlinked as soon as the workers are done, or if writing a later one fails
+    blocks = []
+    try:
+        for positions in shard_by_cc_num(trans_df, n_workers):
+            if len(positions) > 0:
+                blocks.append(_write_shared_frame(trans_df.iloc[positions]))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_run_shard, func, name, size, args) for name, size in blocks]
+    finally:
+        for name, _ in blocks:
+            _unlink_shared(name)
+
+    results = [future.result() for future in futures if future.exception() is None]
+    if len(results) < len(futures):
+        for name, _ in results:
+            _unlink_shared(name)
+        next(future for future in futures if future.exception() is not None).result()
+    return pd.concat([_read_shared_frame(name, size, unlink=True) for name, size in results])
+
+
+def activity_level(trans_df : pd.DataFrame, lag: Union[int, Iterable[int]], n_workers: Optional[int] = None)-> pd.DataFrame:
+    """Parallel `cc_features.activity_level`, with rows in the same order as the serial version."""
+    trans_df = map_shards(trans_df, cc_features.activity_level, lag, n_workers=n_workers)
+    return trans_df.sort_values(["datetime", "cc_num"], kind="mergesort")
+
+
+def aggregate_activity_by_hour(trans_df : pd.DataFrame, window_len, n_workers: Optional[int] = None)-> pd.DataFrame:
+    """Parallel `cc_features.aggregate_activity_by_hour`, with rows in the same order as the serial version."""
+    window_aggs_df = map_shards(trans_df, cc_features.aggregate_activity_by_hour, window_len, n_workers=n_workers)
+    return window_aggs_df.sort_index(kind="mergesort")
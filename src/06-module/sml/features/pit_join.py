@@ -0,0 +1,73 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+from typing import Iterator, List, Optional, Tuple, Union
+
+Frame = Union[pd.DataFrame, pa.Table]
+
+
+def _to_pandas(df : Frame)-> pd.DataFrame:
+    return df.to_pandas() if isinstance(df, pa.Table) else df
+
+
+def _sorted_by(df : pd.DataFrame, on: str)-> pd.DataFrame:
+    if df[on].is_monotonic_increasing:
+        return df
+    return df.sort_values(on, kind="mergesort")
+
+
+def _label_chunks(label_df : pd.DataFrame, chunk_size: Optional[int])-> Iterator[pd.DataFrame]:
+    if chunk_size is None or len(label_df) == 0:
+        yield label_df
+        return
+    for start in range(0, len(label_df), chunk_size):
+        yield label_df.iloc[start:start + chunk_size]
+
+
+def point_in_time_join(label_df : Frame, feature_dfs : List[Frame], on: str = "datetime", by: str = "cc_num",
+                       tolerance: Optional[int] = None, chunk_size: Optional[int] = None)-> pd.DataFrame:
+    """Join each row of `label_df` with, from every frame in `feature_dfs`, the latest row of the same `by` key
+       whose event time `on` is at or before the label's, as the feature store does when it creates training data.
+
+       Every frame must have the `by` and `on` columns; the `on` column of the feature frames is not returned.
+       `tolerance` (in the unit of `on`, e.g. ms for timestamps) drops feature rows older than that.
+       Labels are processed in event time order, `chunk_size` rows at a time: each feature frame is swept once,
+       keeping only the rows of the current chunk and the last row per key before it, so besides the inputs
+       memory is bounded by the chunk size and the number of keys. Rows are returned in event time order.
+    """
+    label_df = _sorted_by(_to_pandas(label_df), on)
+    feature_dfs = [_sorted_by(_to_pandas(feature_df), on) for feature_df in feature_dfs]
+    positions = [0] * len(feature_dfs)
+    carry = [feature_df.iloc[:0] for feature_df in feature_dfs]
+
+    chunks = []
+    for chunk_df in _label_chunks(label_df, chunk_size):
+        joined_df = chunk_df.reset_index(drop=True)
+        for i, feature_df in enumerate(feature_dfs):
+            end = positions[i]
+            if len(chunk_df) > 0:
+                end = int(np.searchsorted(feature_df[on].to_numpy(), chunk_df[on].iloc[-1], side="right"))
+            window_df = pd.concat([carry[i], feature_df.iloc[positions[i]:end]])
+            joined_df = pd.merge_asof(joined_df, window_df, on=on, by=by, tolerance=tolerance,
+                                      direction="backward", allow_exact_matches=True)
+            # The last row per key at or before the end of this chunk is all later chunks can still match.
+            carry[i] = window_df.drop_duplicates(by, keep="last")
+            positions[i] = end
+        chunks.append(joined_df)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def create_fraud_training_data(labels_df : Frame, trans_df : Frame, window_aggs_df : Frame, profiles_df : Frame,
+                               chunk_size: Optional[int] = None)-> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Local equivalent of `transactions_fraud_online_fv.get_training_data` (without the transformation functions),
+       from the DataFrames of `transactions_fraud_label_online`, `transactions_fraud_online`, `cc_trans_fraud_4h`
+       and `profile_fraud_online`, using the same query as `3_feature_view_creation`. Returns the features and labels.
+    """
+    labels_df = _to_pandas(labels_df)[["cc_num", "datetime", "fraud_label"]]
+    trans_df = _to_pandas(trans_df).drop(columns=["month", "tid", "city", "country"])
+    window_aggs_df = _to_pandas(window_aggs_df).drop(columns=["month"])
+    profiles_df = _to_pandas(profiles_df)[["cc_num", "datetime", "sex"]]
+
+    training_df = point_in_time_join(labels_df, [trans_df, window_aggs_df, profiles_df], chunk_size=chunk_size)
+    return training_df.drop(columns=["fraud_label"]), training_df[["fraud_label"]]
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Union
+
+
+def _plain(value):
+    # NumPy scalars are not JSON serializable, and keys read back from the log must equal the ones put.
+    return value.item() if hasattr(value, "item") else value
+
+
+class WriteBehindBuffer:
+    """Queue of updates to a feature group that keeps the latest values per primary key, such as the latest
+       recorded transaction of each card in `latest_recorded_transactions_fraud_online`, and inserts them in batches
+       from a background thread instead of with one insert (and one ingestion job) per event.
+
+       A batch is inserted when `max_rows` keys are pending or the oldest pending update has waited `max_delay`
+       seconds. Every update is appended to the log at `log_path` before `put` returns (and synced to disk with
+       `fsync=True`, to survive a power loss and not only a crash of the process), and the log is rewritten
+       with what is still pending after each successful insert, so updates not inserted when the process stops are
+       read back and inserted by the next buffer on the same log. A failed insert is retried with the next batch.
+       `on_flush` is called with each inserted DataFrame, e.g. to invalidate cached feature vectors.
+    """
+
+    def __init__(self, feature_group, log_path: str, primary_key: Iterable[str] = ("cc_num",), event_time: str = "datetime",
+                 max_rows: int = 500, max_delay: float = 5.0, write_options: Optional[dict] = None,
+                 on_flush: Optional[Callable[[pd.DataFrame], None]] = None, fsync: bool = False):
+        self.feature_group = feature_group
+        self.log_path = log_path
+        self.primary_key = list(primary_key)
+        self.event_time = event_time
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.write_options = write_options if write_options is not None else {"wait_for_job": False}
+        self.on_flush = on_flush
+        self.fsync = fsync
+        self.flushed = 0
+        self.errors: List[Exception] = []
+
+        self._pending: Dict[Hashable, dict] = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._recover()
+        self._log = open(self.log_path, "a")
+        # a line cut short at the end of the log would swallow the next update appended to it
+        self._rewrite_log()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def __len__(self)-> int:
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key(self, row: dict)-> tuple:
+        return tuple(row[column] for column in self.primary_key)
+
+    def _keep_latest(self, row: dict)-> bool:
+        key = self._key(row)
+        pending = self._pending.get(key)
+        if pending is not None and pending[self.event_time] > row[self.event_time]:
+            return False
+        self._pending[key] = row
+        return True
+
+    def _recover(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path) as log:
+            for line in log:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # the last line is cut short if the process stopped while writing it
+                    continue
+                self._keep_latest(row)
+        if self._pending:
+            self._oldest = time.monotonic()
+
+    def put(self, rows : Union[pd.DataFrame, dict]):
+        """Queue the rows of a DataFrame, or one row as a dict, keeping the latest update per primary key."""
+        records = rows.to_dict("records") if isinstance(rows, pd.DataFrame) else [rows]
+        records = [{column: _plain(value) for column, value in record.items()} for record in records]
+        with self._lock:
+            if self._closed:
+                raise ValueError("put on a closed WriteBehindBuffer")
+            self._log.write("".join(json.dumps(record) + "\n" for record in records))
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            for record in records:
+                self._keep_latest(record)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._pending) >= self.max_rows:
+                self._wakeup.notify()
+
+    def _due(self)-> bool:
+        return len(self._pending) >= self.max_rows or \
+            (self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay)
+
+    def _run(self):
+        with self._lock:
+            while not self._closed:
+                if not self._due():
+                    timeout = self.max_delay if self._oldest is None else self.max_delay - (time.monotonic() - self._oldest)
+                    self._wakeup.wait(max(timeout, 0.0))
+                    continue
+                errors = len(self.errors)
+                self._lock.release()
+                try:
+                    self.flush()
+                finally:
+                    self._lock.acquire()
+                if len(self.errors) > errors and not self._closed:
+                    # wait before retrying a failed insert
+                    self._wakeup.wait(self.max_delay)
+
+    def _rewrite_log(self):
+        # Only what is still pending has to survive a restart; replace the log atomically.
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "w") as log:
+            log.write("".join(json.dumps(row) + "\n" for row in self._pending.values()))
+            log.flush()
+            os.fsync(log.fileno())
+        self._log.close()
+        os.replace(tmp_path, self.log_path)
+        self._log = open(self.log_path, "a")
+
+    def flush(self)-> int:
+        """Insert the pending updates now. Returns the number of rows inserted."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._oldest = self._pending, {}, None
+            if not batch:
+                return 0
+            df = pd.DataFrame(list(batch.values()))
+            try:
+                self.feature_group.insert(df, write_options=self.write_options)
+            except Exception as err:
+                self.errors.append(err)
+                with self._lock:
+                    for row in batch.values():
+                        self._keep_latest(row)
+                    self._oldest = time.monotonic()
+                return 0
+            with self._lock:
+                self._rewrite_log()
+                if self._pending and self._oldest is None:
+                    self._oldest = time.monotonic()
+            self.flushed += len(df)
+            if self.on_flush is not None:
+                self.on_flush(df)
+            return len(df)
+
+    def close(self):
+        """Stop the background thread and insert what is pending."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+        self.flush()
+        self._log.close()
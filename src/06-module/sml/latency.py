@@ -0,0 +1,192 @@
+"""Per-stage latency histograms for the online prediction path.
+
+    with latency.recorder.timer("feature_vector"):
+        feature_vector = fv.get_feature_vector({"cc_num": cc_num})
+
+    latency.recorder.snapshot()           # {"feature_vector": {"count": ..., "p50_ms": ..., ...}}
+    latency.recorder.to_prometheus()      # Prometheus text format
+
+Timings go into histograms with logarithmic buckets of constant relative width, like HdrHistogram, so recording
+is O(1) and memory is bounded whatever the range of latencies. The module only uses the standard library, so it
+can be shipped with the model artifacts for the predictor script. Set SML_LATENCY=0 to disable the timers.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+from typing import Callable, Dict, Iterable, Optional
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+
+class Histogram:
+    """Counts of values (integer microseconds) in buckets whose width is at most 2**-precision_bits of the values
+       in them, e.g. 1/128 with the default, so quantiles are within that relative error.
+    """
+
+    def __init__(self, precision_bits: int = 7):
+        self.precision_bits = precision_bits
+        self._sub_buckets = 1 << precision_bits
+        self._half = self._sub_buckets >> 1
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def _index(self, value: int)-> int:
+        if value < self._sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits
+        return self._sub_buckets + (shift - 1) * self._half + (value >> shift) - self._half
+
+    def _upper(self, index: int)-> int:
+        if index < self._sub_buckets:
+            return index
+        shift, offset = divmod(index - self._sub_buckets, self._half)
+        shift += 1
+        return ((offset + self._half + 1) << shift) - 1
+
+    def record(self, value: int):
+        value = max(int(value), 0)
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "Histogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float)-> int:
+        """Upper bound of the bucket holding the `q` quantile, capped by the largest value recorded."""
+        if self.count == 0:
+            return 0
+        rank = max(1, int(round(q * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    def summary(self, quantiles: Iterable[float] = QUANTILES)-> dict:
+        """Count, mean, min, max and quantiles, in milliseconds."""
+        summary = {"count": self.count,
+                   "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+                   "min_ms": (self.min or 0) / 1000,
+                   "max_ms": (self.max or 0) / 1000}
+        for q in quantiles:
+            summary[f"p{q * 100:g}_ms"] = self.quantile(q) / 1000
+        return summary
+
+
+class _Timer:
+    __slots__ = ("recorder", "stage", "start")
+
+    def __init__(self, recorder, stage):
+        self.recorder = recorder
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record_ns(self.stage, time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class LatencyRecorder:
+    """Histograms of the latency of named stages. When disabled, `timer` returns a shared no-op context manager
+       and `timed` functions call straight through, so instrumentation can stay in place.
+    """
+
+    def __init__(self, enabled: bool = True, precision_bits: int = 7):
+        self.enabled = enabled
+        self.precision_bits = precision_bits
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, stage: str)-> Histogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram(self.precision_bits))
+        return histogram
+
+    def record_ns(self, stage: str, nanoseconds: int):
+        self._histogram(stage).record(nanoseconds // 1000)
+
+    def record(self, stage: str, seconds: float):
+        if self.enabled:
+            self._histogram(stage).record(seconds * 1e6)
+
+    def timer(self, stage: str):
+        """Context manager recording the time spent in its block under `stage`."""
+        return _Timer(self, stage) if self.enabled else _NULL_TIMER
+
+    def timed(self, stage: Optional[str] = None)-> Callable:
+        """Decorator recording the time spent in each call under `stage` (by default the function's name)."""
+        def decorator(func):
+            name = stage or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record_ns(name, time.perf_counter_ns() - start)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def snapshot(self)-> dict:
+        return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def to_json(self)-> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, name: str = "sml_stage_latency_seconds")-> str:
+        """Snapshot in the Prometheus text exposition format, as a summary per stage."""
+        lines = [f"# HELP {name} Latency of the stages of the online prediction path.", f"# TYPE {name} summary"]
+        for stage, histogram in sorted(self.histograms.items()):
+            for q in QUANTILES:
+                lines.append(f'{name}{{stage="{stage}",quantile="{q:g}"}} {histogram.quantile(q) / 1e6:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total / 1e6:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+# Recorder shared by the online apps, the predictor and `sml.features.online_features`.
+recorder = LatencyRecorder(enabled=os.environ.get("SML_LATENCY", "1") != "0")
@@ -0,0 +1,96 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Iterable, Optional, Tuple
+
+# Thresholds chosen with `sweep_cascade_rules` on the synthetic transactions of 1_backfill_cc_feature_groups (seed 12345,
+# FRAUD_RATIO 0.003: 71,323 transactions, 142 frauds), as the largest skip rate with an amount cap within a 1% recall
+# budget: 11.5% of the transactions are skipped, and 1 of the 142 frauds, 0.7% of recall, is lost. Sweep again on the
+# labels of real transactions before enabling them in production.
+TUNED_RULES = {"max_amount": 500.0, "max_loc_delta": 0.001, "min_time_delta": 1 / 24}
+
+
+class CascadeRules:
+    """First stage of a cascade: transactions with at most `max_amount`, at most `max_loc_delta` from the previous
+       transaction of the card (`loc_delta_t_minus_1`) and at least `min_time_delta` days after it
+       (`time_delta_t_minus_1`) are taken as not fraudulent, without looking up their features or calling the model.
+       Amounts are in the units of the raw transactions, before the transformation functions of the feature view.
+       A rule set to None does not constrain, and with no rule set (the default) nothing is skipped, so the cascade
+       is opt-in: e.g. `CascadeRules(**TUNED_RULES)`, after checking the thresholds with `cascade_report`.
+    """
+
+    def __init__(self, max_amount: Optional[float] = None, max_loc_delta: Optional[float] = None,
+                 min_time_delta: Optional[float] = None):
+        self.max_amount = max_amount
+        self.max_loc_delta = max_loc_delta
+        self.min_time_delta = min_time_delta
+
+    def __repr__(self)-> str:
+        return (f"CascadeRules(max_amount={self.max_amount}, max_loc_delta={self.max_loc_delta}, "
+                f"min_time_delta={self.min_time_delta})")
+
+    def skip(self, amounts, loc_deltas, time_deltas)-> np.ndarray:
+        """Which transactions the first stage decides on its own."""
+        if self.max_amount is None and self.max_loc_delta is None and self.min_time_delta is None:
+            return np.zeros(np.shape(amounts), dtype=bool)
+        skip = np.ones(np.shape(amounts), dtype=bool)
+        if self.max_amount is not None:
+            skip &= np.asarray(amounts) <= self.max_amount
+        if self.max_loc_delta is not None:
+            skip &= np.asarray(loc_deltas) <= self.max_loc_delta
+        if self.min_time_delta is not None:
+            skip &= np.asarray(time_deltas) >= self.min_time_delta
+        return skip
+
+
+def cascade_predict(rules : CascadeRules, amounts, loc_deltas, time_deltas,
+                    predict : Callable[[np.ndarray], Iterable])-> Tuple[np.ndarray, np.ndarray]:
+    """Predictions of a cascade: 0 for the transactions `rules` skip, and `predict` for the others. `predict` is
+       called once with the positions of those transactions (and not at all when every one is skipped), so the
+       feature lookups happen only for them. Returns the predictions and which transactions were skipped.
+    """
+    skipped = rules.skip(amounts, loc_deltas, time_deltas)
+    predictions = np.zeros(len(skipped), dtype=np.int64)
+    borderline = np.flatnonzero(~skipped)
+    if len(borderline) > 0:
+        predictions[borderline] = np.asarray(predict(borderline))
+    return predictions, skipped
+
+
+def cascade_report(rules : CascadeRules, amounts, loc_deltas, time_deltas, labels, predictions=None)-> dict:
+    """How `rules` would do on labelled transactions: the share of transactions skipped, and the share of
+       frauds (`labels` == 1) they let through to the model. With the model's `predictions` for all transactions,
+       also its recall on its own and in the cascade.
+    """
+    labels = np.asarray(labels).ravel()
+    skipped = rules.skip(amounts, loc_deltas, time_deltas)
+    frauds = labels == 1
+    report = {
+        "transactions": len(labels),
+        "skip_rate": float(skipped.mean()) if len(labels) else 0.0,
+        "frauds": int(frauds.sum()),
+        "frauds_skipped": int((frauds & skipped).sum()),
+        "recall": float((frauds & ~skipped).sum() / frauds.sum()) if frauds.any() else 1.0,
+    }
+    if predictions is not None:
+        detected = np.asarray(predictions).ravel() == 1
+        report["model_recall"] = float((frauds & detected).sum() / frauds.sum()) if frauds.any() else 1.0
+        report["cascade_recall"] = float((frauds & detected & ~skipped).sum() / frauds.sum()) if frauds.any() else 1.0
+    return report
+
+
+def sweep_cascade_rules(df : pd.DataFrame, max_amounts: Iterable, max_loc_deltas: Iterable, min_time_deltas: Iterable,
+                        label: str = "fraud_label", predictions=None)-> pd.DataFrame:
+    """`cascade_report` for every combination of thresholds, on a DataFrame with the columns `amount`,
+       `loc_delta_t_minus_1`, `time_delta_t_minus_1` and `label`, sorted by decreasing recall and skip rate.
+    """
+    reports = []
+    for max_amount, max_loc_delta, min_time_delta in itertools.product(max_amounts, max_loc_deltas, min_time_deltas):
+        rules = CascadeRules(max_amount, max_loc_delta, min_time_delta)
+        report = cascade_report(rules, df["amount"], df["loc_delta_t_minus_1"], df["time_delta_t_minus_1"],
+                                df[label], predictions)
+        reports.append({"max_amount": max_amount, "max_loc_delta": max_loc_delta, "min_time_delta": min_time_delta,
+                        **report})
+    return pd.DataFrame(reports).sort_values(["recall", "skip_rate"], ascending=False, ignore_index=True)
@@ -0,0 +1,152 @@
+import json
+
+import numpy as np
+
+from typing import Dict
+
+# Objectives whose predictions are the margin, or the sigmoid of it.
+_IDENTITY_OBJECTIVES = ("reg:squarederror", "binary:logitraw")
+_LOGISTIC_OBJECTIVES = ("binary:logistic",)
+
+
+def export_xgboost(model)-> Dict[str, np.ndarray]:
+    """Flatten a trained XGBoost model (an `XGBClassifier`/`XGBRegressor` or a `Booster`) with a single output into
+       arrays over the nodes of all trees: the feature each node splits on, its threshold, its children (as indexes
+       in the same arrays), the side missing values go to and the leaf values, plus the root of every tree.
+       Leaves are their own children, so every row can take the same number of steps down every tree.
+    """
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+    model_param = learner["learner_model_param"]
+    objective = learner["objective"]["name"]
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise ValueError(f"Only gbtree boosters can be exported, not {learner['gradient_booster']['name']}")
+    if objective not in _IDENTITY_OBJECTIVES + _LOGISTIC_OBJECTIVES or int(model_param.get("num_class", 0)) > 1:
+        raise ValueError(f"Objective {objective} is not supported")
+
+    features, thresholds, left, right, default_left, values, roots, depths = [], [], [], [], [], [], [], []
+    offset = 0
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+        tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+        nodes = np.arange(len(tree_left))
+        is_leaf = tree_left == -1
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+
+        features.append(np.where(is_leaf, 0, tree["split_indices"]))
+        thresholds.append(np.where(is_leaf, np.float32(0), conditions))
+        left.append(np.where(is_leaf, nodes, tree_left) + offset)
+        right.append(np.where(is_leaf, nodes, tree_right) + offset)
+        default_left.append(np.asarray(tree["default_left"], dtype=bool))
+        # XGBoost keeps the value of a leaf in its split condition.
+        values.append(np.where(is_leaf, conditions, np.float32(0)))
+        roots.append(offset)
+        depths.append(_depth(tree_left, tree_right))
+        offset += len(tree_left)
+
+    base_score = np.float32(str(model_param["base_score"]).strip("[]"))
+    if objective in _LOGISTIC_OBJECTIVES:
+        base_margin = np.float32(-np.log(np.float32(1) / base_score - np.float32(1)))
+    else:
+        base_margin = base_score
+    return {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(np.float32),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "default_left": np.concatenate(default_left),
+        "value": np.concatenate(values).astype(np.float32),
+        "root": np.asarray(roots, dtype=np.int32),
+        "max_depth": np.asarray(max(depths, default=0)),
+        "base_margin": np.asarray(base_margin, dtype=np.float32),
+        "n_features": np.asarray(int(model_param["num_feature"])),
+        "logistic": np.asarray(objective in _LOGISTIC_OBJECTIVES),
+    }
+
+
+def _depth(left : np.ndarray, right : np.ndarray)-> int:
+    depth, level = 0, [0]
+    while True:
+        level = [child for node in level for child in (left[node], right[node]) if child != -1]
+        if not level:
+            return depth
+        depth += 1
+
+
+def save_xgboost(model, path: str):
+    """Export `model` with `export_xgboost` to an uncompressed `.npz` file, which `TreeEnsemble.load` reads."""
+    np.savez(path, **export_xgboost(model))
+
+
+class TreeEnsemble:
+    """Predictions of an XGBoost model from the arrays of `export_xgboost`, with NumPy only.
+
+       Rows go down all trees together, one level per step, computing in float32 and adding the trees in order
+       as XGBoost does, so margins and classes are exactly the booster's. `predict` returns the classes, like
+       `XGBClassifier.predict`, for the predictor in `predict_example.py`.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        # children[1] is the left child, so `children[go_left, node]` takes one step
+        self.children = np.stack([self.right, self.left])
+        self.default_left = arrays["default_left"]
+        self.value = arrays["value"]
+        self.root = arrays["root"]
+        self.max_depth = int(arrays["max_depth"])
+        self.base_margin = np.float32(arrays["base_margin"])
+        self.n_features_in_ = int(arrays["n_features"])
+        self.logistic = bool(arrays["logistic"])
+
+    @classmethod
+    def load(cls, path: str, shared: bool = False):
+        """Load the arrays saved by `save_xgboost`. With `shared`, they are attached read-only with
+           `shared_arrays.attach_npz` instead, so that the processes of a host loading the same file share them.
+        """
+        if shared:
+            try:
+                from sml.shared_arrays import attach_npz
+            except ImportError:
+                # saved next to this module with the model artifacts
+                from shared_arrays import attach_npz
+            return cls(attach_npz(path))
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def margin(self, X)-> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        rows = np.arange(len(X))[:, None]
+        has_missing = np.isnan(X).any()
+        node = np.broadcast_to(self.root, (len(X), len(self.root)))
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = x < self.threshold[node]
+            if has_missing:
+                go_left |= np.isnan(x) & self.default_left[node]
+            node = self.children[go_left.view(np.int8), node]
+        leaves = np.empty((len(X), len(self.root) + 1), dtype=np.float32)
+        leaves[:, 0] = self.base_margin
+        leaves[:, 1:] = self.value[node]
+        # cumsum adds the trees one after the other, in float32 like XGBoost (sum would add them pairwise)
+        return np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1]
+
+    def predict_proba(self, X)-> np.ndarray:
+        margin = self.margin(X)
+        if not self.logistic:
+            raise ValueError("predict_proba needs a binary:logistic model")
+        # exp in float64 rounded to float32 is closer to the expf of XGBoost than exp in float32: probabilities
+        # are the booster's, or at most one float32 step away from them
+        positive = np.float32(1) / (np.float32(1) + np.exp(-margin.astype(np.float64)).astype(np.float32))
+        return np.stack([np.float32(1) - positive, positive], axis=1)
+
+    def predict(self, X)-> np.ndarray:
+        if not self.logistic:
+            return self.margin(X)
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(np.int64)
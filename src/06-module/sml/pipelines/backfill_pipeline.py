@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from sml.features import cc_features
+
+
+def split_by_month(trans_df : pd.DataFrame)-> Iterator[pd.DataFrame]:
+    """Yield the transactions of each `month` partition, oldest month first."""
+    for _, month_df in trans_df.groupby("month", sort=True):
+        yield month_df
+
+
+def _carry_over_rows(features_df : pd.DataFrame, cc_nums : np.ndarray, lag: int, window_len: int, final: bool):
+    """Return, in sorted transaction order, the positions that are pending (their lag features need
+       transactions from a later partition) and the positions to carry over to the next partition.
+    """
+    # `activity_level` sorts by ["datetime", "cc_num"] and keeps the original index, so the index of its
+    # output is the transaction order that the lag and window features are computed in.
+    order = features_df.index.to_numpy()
+    cards = cc_nums[order]
+    rank_from_end = pd.Series(cards).groupby(cards).cumcount(ascending=False).to_numpy()
+
+    pending = np.zeros(len(cc_nums), dtype=bool)
+    if not final:
+        pending[order[rank_from_end < lag]] = True
+    # Each card keeps its last `lag` transactions (not yet final) plus the `window_len - 1` transactions
+    # before them, which the rolling window of the first pending transaction looks back on.
+    carry = order[rank_from_end < lag + window_len - 1] if not final else order[:0]
+    return pending, carry
+
+
+def _process_partition(work_df : pd.DataFrame, done : np.ndarray, profiles_df : pd.DataFrame, credit_cards_df : pd.DataFrame,
+                       lags: List[int], window_len: int, final: bool):
+    trans_df, trans_profiles_df = cc_features.card_owner_age(work_df.copy(), profiles_df)
+    trans_df = cc_features.expiry_days(trans_df, credit_cards_df)
+    trans_df = cc_features.activity_level(trans_df, lags)
+    window_aggs_df = cc_features.aggregate_activity_by_hour(trans_df, window_len)
+
+    pending, carry = _carry_over_rows(trans_df, work_df["cc_num"].to_numpy(), lags[-1], window_len, final)
+    emit = ~done & ~pending
+
+    trans_df = trans_df[emit[trans_df.index]]
+    trans_profiles_df = trans_profiles_df[emit[trans_profiles_df.index]].copy()
+    trans_profiles_df.datetime = trans_profiles_df.datetime.map(lambda x: cc_features.date_to_timestamp(x))
+    window_aggs_df = window_aggs_df[emit[window_aggs_df.index]]
+
+    carry_df = work_df.iloc[carry]
+    carry_done = ~pending[carry]
+    return (trans_df, trans_profiles_df, window_aggs_df), carry_df, carry_done
+
+
+def backfill_by_month(partitions : Iterable[pd.DataFrame], profiles_df : pd.DataFrame, credit_cards_df : pd.DataFrame,
+                      lag: Union[int, Iterable[int]] = 1, window_len: int = 4)-> Iterator[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+    """Compute the backfill features one `month` partition at a time.
+
+       `partitions` yields raw transactions (as returned by `synthetic_data.create_transactions_as_df`), one month
+       at a time and in chronological order, e.g. `split_by_month(trans_df)` or a generator reading one month of
+       the source table per step. For every partition this yields `(trans_df, profiles_df, window_aggs_df)`,
+       ready to be inserted in `transactions_fraud_online`, `profile_fraud_online` and `cc_trans_fraud_{window_len}h`.
+
+       The last `max(lag) + window_len - 1` transactions of each card are carried over to the next partition, so
+       the features are the same as running `activity_level` and `aggregate_activity_by_hour` over the full
+       history, while memory is bounded by the largest partition. Transactions whose lag features depend on
+       the next partition are emitted with that partition (or with the last one, at the end of the history).
+       Lag 1 is always computed, as the window aggregates are computed from `loc_delta_t_minus_1`.
+    """
+    lags = sorted({1} | ({lag} if isinstance(lag, int) else set(lag)))
+    carry_df = None
+    carry_done = np.zeros(0, dtype=bool)
+    for month_df in partitions:
+        if len(month_df) == 0:
+            continue
+        work_df = pd.concat([carry_df, month_df]) if carry_df is not None else month_df
+        done = np.concatenate([carry_done, np.zeros(len(month_df), dtype=bool)])
+        features, carry_df, carry_done = _process_partition(work_df.reset_index(drop=True), done, profiles_df,
+                                                            credit_cards_df, lags, window_len, final=False)
+        yield features
+
+    if carry_df is not None and not carry_done.all():
+        features, _, _ = _process_partition(carry_df.reset_index(drop=True), carry_done, profiles_df,
+                                            credit_cards_df, lags, window_len, final=True)
+        yield features
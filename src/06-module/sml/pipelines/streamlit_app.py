@@ -1,6 +1,11 @@
 import datetime
-from math import radians
-from sml import cc_features
+import os
+from sml.features import cc_features
+from sml.features import feature_cache
+from sml.features import online_features
+from sml.features import write_behind
+from sml.models import cascade
+from sml import latency
 
 import pandas as pd
 import numpy as np
@@ -9,7 +14,7 @@ from matplotlib import pyplot
 import warnings
 
 import hopsworks
-from sml import synthetic_data
+from sml.features import synthetic_data
 
 import streamlit as st
 
@@ -65,35 +70,99 @@ def explore_data():
     st.plotly_chart(fig1)
 
 
-def process_input_vector(cc_num, current_datetime, amount, long, lat):
-    long = radians(long)
-    lat = radians(lat)
+@st.cache(suppress_st_warning=True, allow_output_mutation=True)
+def get_streaming_engine():
+    # Last recorded transaction per card, kept in memory so requests don't look it up remotely.
+    latest_records = latest_record_fv.get_batch_data()
+    return cc_features.StreamingFeatureEngine.from_frame(latest_records)
+
+
+@st.cache(suppress_st_warning=True, allow_output_mutation=True)
+def get_card_static_features():
+    # birthdate, card expiry and sex of every card, to compute the card features of a request locally;
+    # snapshot built and uploaded by 1_backfill_cc_feature_groups
+    path = project.get_dataset_api().download("Resources/card_static_features.npz", overwrite=True)
+    return cc_features.CardStaticFeatures.load(path)
+
+
+@st.cache(suppress_st_warning=True, allow_output_mutation=True)
+def get_feature_cache():
+    # the latest records are invalidated by the writer, the profile and 4h window features change on their own
+    return feature_cache.FeatureVectorCache(ttls={"latest_recorded_transactions_fraud_online_fv": None,
+                                                  "transactions_fraud_online_fv": 60})
+
+
+@st.cache(suppress_st_warning=True, allow_output_mutation=True)
+def get_latest_record_writer():
+    latest_recorded_transactions_fraud_online_fg = fs.get_or_create_feature_group(
+        name="latest_recorded_transactions_fraud_online",
+        version=1
+    )
+    # inserted in batches from a background thread, keeping the latest transaction per card
+    return write_behind.WriteBehindBuffer(
+        latest_recorded_transactions_fraud_online_fg, "latest_recorded_transactions_fraud_online.log",
+        on_flush=lambda df: cache.invalidate_rows(df, [(latest_record_fv.name, latest_record_fv.version)]))
+
+
+@st.cache(suppress_st_warning=True, allow_output_mutation=True)
+def get_feature_transformations():
+    # the transformation functions the feature view applies to passed features, with the training dataset statistics
+    fv.init_serving(1)
+    return online_features.feature_view_transformations(fv)
+
+
+@st.cache(suppress_st_warning=True, allow_output_mutation=True)
+def get_feature_layout():
+    # positions of the model inputs in the feature vectors, looked up by name once
+    model = project.get_model_registry().get_model("transactions_fraud_online_xgboost", version=1)
+    return online_features.FeatureVectorLayout.compile(fv, model.model_schema)
 
+
+def process_input_vector(cc_num, current_datetime, amount, long, lat):
     current_coordinates = pd.DataFrame({
         "datetime": [int(current_datetime)],
         "cc_num": [cc_num],
-        "latitude": [long],
-        "longitude": [lat]
+        "latitude": [lat],
+        "longitude": [long]
 
     })
 
-    # get fv for the latest recorded transactions 
-    latest_record_vector = latest_record_fv.get_feature_vector({"cc_num": cc_num})
-    # compute deltas between previous and current
-    loc_delta_t_minus_1 = cc_features.haversine_distance(long=long, lat=lat, prev_long=latest_record_vector[3],
-                                                         prev_lat=latest_record_vector[2])
-    time_delta_t_minus_1 = cc_features.time_delta(cc_features.timestamp_to_date(latest_record_vector[0]),
-                                                  cc_features.timestamp_to_date(current_datetime))
-    time_delta_t_minus_1 = cc_features.time_delta_to_days(time_delta_t_minus_1)
-    # get all features
-    feature_vector = fv.get_feature_vector({"cc_num": cc_num},
-                                           passed_features={"amout": amount,
-                                                            "loc_delta_t_minus_1": loc_delta_t_minus_1,
-                                                            "time_delta_t_minus_1": time_delta_t_minus_1})
-
-    # drop extra features
-    indexes_to_remove = [0, 1]
-    return {"inputs": [i for j, i in enumerate(feature_vector) if j not in indexes_to_remove]}, current_coordinates
+    # age, days until the card expires and sex at the time of the request
+    with latency.recorder.timer("card_features"):
+        card_features = cards.features(cc_num, current_datetime) if cc_num in cards else {}
+    passed_features = {"amount": amount, **card_features}
+
+    # cards recorded after the engine was built: their latest transaction and their features are looked up at the
+    # same time, then the latest transaction is kept in the engine
+    feature_vector = None
+    if cc_num not in engine:
+        with latency.recorder.timer("concurrent_lookup"):
+            feature_vector = online_features.get_feature_vector_concurrent(
+                fv, latest_record_fv, cc_num, current_datetime, long, lat, passed_features=passed_features,
+                transformations=transformations, lookup=cache.get_feature_vector)
+        # cached by the lookup above
+        latest_record_vector = cache.get_feature_vector(latest_record_fv, {"cc_num": cc_num})
+        if latest_record_vector is not None:
+            engine.record({"datetime": latest_record_vector[0], "cc_num": cc_num,
+                           "latitude": latest_record_vector[2], "longitude": latest_record_vector[3]})
+
+    # compute deltas between the latest recorded transaction and the current one
+    with latency.recorder.timer("lag_features"):
+        lag_features = engine.lag_features(current_coordinates.iloc[0])
+    # obviously benign transactions are decided without the feature lookup and the model
+    if rules.skip(amount, lag_features["loc_delta_t_minus_1"], lag_features["time_delta_t_minus_1"]):
+        return None, current_coordinates
+    # get all features: the stored ones from the cache, the passed ones transformed locally as the feature view would
+    if feature_vector is None:
+        with latency.recorder.timer("feature_vector"):
+            feature_vector = cache.get_feature_vector(fv, {"cc_num": cc_num})
+        feature_vector = online_features.apply_passed_features(feature_vector, feature_names,
+                                                               {**passed_features, **lag_features}, transformations)
+
+    # keep the model inputs
+    with latency.recorder.timer("assemble"):
+        inputs = layout.fill(feature_vector).tolist()
+    return {"inputs": inputs}, current_coordinates
 
 
 def print_fancy_header(text, font_size=24):
@@ -123,6 +192,15 @@ progress_bar.progress(40)
 st.write(36 * "-")
 print_fancy_header('\n✨ Feature view retrieving...')
 fv, latest_record_fv = get_feature_views()
+engine = get_streaming_engine()
+cards = get_card_static_features()
+cache = get_feature_cache()
+transformations = get_feature_transformations()
+feature_names = online_features.serving_feature_names(fv)
+layout = get_feature_layout()
+writer = get_latest_record_writer()
+# the rule pre-filter is off unless SML_CASCADE=1, see cascade.TUNED_RULES for the recall it costs
+rules = cascade.CascadeRules(**cascade.TUNED_RULES) if os.environ.get("SML_CASCADE", "0") == "1" else cascade.CascadeRules()
 st.write("✅ Retrieved!")
 
 progress_bar.progress(55)
@@ -179,7 +257,8 @@ data, current_coordinates = process_input_vector(cc_num=int(cc_num),
                             lat=lat, long=long)
 
 if st.button('📊 Make a prediction'):
-    res = deployment.predict(data)
+    with latency.recorder.timer("deployment_predict"):
+        res = deployment.predict(data) if data is not None else {"predictions": [0]}
     progress_bar.progress(80)
     negative = "**👌 Not a suspicious**"
     positive = "**🆘 Fraudulent**"
@@ -193,10 +272,10 @@ if st.button('📊 Make a prediction'):
     st.write('\n🎉 📈 🤝 App Finished Successfully 🤝 📈 🎉')
 
     # update fg
-    latest_recorded_transactions_fraud_online_fg = fs.get_or_create_feature_group(
-        name="latest_recorded_transactions_fraud_online",
-        version=1
-    )
-    latest_recorded_transactions_fraud_online_fg.insert(current_coordinates)
+    writer.put(current_coordinates)
+    engine.record(current_coordinates.iloc[0])
+
+with st.expander("⏱ Latency per stage"):
+    st.json(latency.recorder.snapshot())
 
 st.button("Re-run")
@@ -1,7 +1,9 @@
 import datetime
+import functools
 import joblib
 from math import radians
 from sml import cc_features
+from sml.pipelines import batch_scoring
 
 import pandas as pd
 import numpy as np
@@ -31,14 +33,20 @@ warnings.filterwarnings("ignore")
 project = hopsworks.login()
 fs = project.get_feature_store()
 
-@st.cache(allow_output_mutation=True, suppress_st_warning=True)
-def retrive_dataset(start_date, end_date):
+def score_dataset(scorer, start_date, end_date):
+    # The window is read and scored a few hours at a time, so only one chunk is in memory.
     st.write(36 * "-")
-    print_fancy_header('\n💾 Dataset Retrieving...')
+    print_fancy_header('\n💾 Dataset Retrieving and Scoring...')
     feature_view = fs.get_feature_view("transactions_fraud_online_fv", 1)
-    batch_data = feature_view.get_batch_data(start_time = start_date, end_time = end_date)
-    batch_data.drop(["cc_num", "datetime"], axis = 1, inplace=True)
-    return batch_data
+    chunks = batch_scoring.iter_batch_data(feature_view, start_date, end_date, chunk=datetime.timedelta(hours=6))
+    status = st.empty()
+
+    def show_progress(results_df, summary):
+        status.write(f"✅ Scored {summary['rows']} transactions ({summary['chunks']} chunks), "
+                     f"{scorer.report['workers']} workers at {scorer.report['efficiency']:.0%} efficiency")
+
+    return batch_scoring.run_batch_scoring(chunks, scorer.predict, drop_columns=["cc_num", "datetime"],
+                                           on_chunk=show_progress)
 
 
 @st.cache(suppress_st_warning=True, allow_output_mutation=True)
@@ -55,12 +63,20 @@ def get_model(project = project):
     model_dir = model.download()
     return joblib.load(model_dir + "/xgboost.pkl")
 
-def explore_data(batch_data):
+
+@st.cache(allow_output_mutation=True, suppress_st_warning=True)
+def get_scorer(project = project):
+    # A pool of processes, each loading the model once, which score the rows of a chunk in parallel.
+    mr = project.get_model_registry()
+    model = mr.get_model("transactions_fraud_online_xgboost", version = 1)
+    model_dir = model.download()
+    return batch_scoring.ParallelScorer(functools.partial(joblib.load, model_dir + "/xgboost.pkl"))
+
+def explore_data(counts):
     st.write(36 * "-")
     print_fancy_header('\n👁 Data Exploration...')
     labels = ["Normal", "Fraudulent"]
-    unique, counts = np.unique(batch_data.fraud.values, return_counts=True)
-    values = counts.tolist()
+    values = [counts.get(0, 0), counts.get(1, 0)]
 
     def plot_pie(values, labels):
         fig = px.pie(values=values, names=labels, title='Distribution of predicted fraud transactions')
@@ -74,9 +90,6 @@ def print_fancy_header(text, font_size=24):
     res = f'<span style="color:#ff5f27; font-size: {font_size}px;">{text}</span>'
     st.markdown(res, unsafe_allow_html=True)
 
-def transform_preds(predictions):
-    return ['Fraud' if pred == 1 else 'Not Fraud' for pred in predictions]    
-
 progress_bar = st.sidebar.header('⚙️ Working Progress')
 progress_bar = st.sidebar.progress(0)
 st.title('🆘 Fraud transactions detection 🆘')
@@ -96,15 +109,9 @@ st.write(36 * "-")
 print_fancy_header('\n✨ Fetch batch data and predict')
 fv, latest_record_fv = get_feature_views()
 
-batch_data = retrive_dataset(start_date, end_date)
-st.write("✅ Retrieved!")
-progress_bar.progress(55)
-
 if st.button('📊 Make a prediction'):
-    predictions = model.predict(batch_data)
-    predictions = transform_preds(predictions)
-    batch_data_to_explore = batch_data.copy()
-    batch_data_to_explore['fraud'] = predictions
-    explore_data(batch_data_to_explore)
+    summary = score_dataset(get_scorer(project), start_date, end_date)
+    progress_bar.progress(55)
+    explore_data(summary["counts"])
 
 st.button("Re-run")
@@ -0,0 +1,48 @@
+"""Read-only arrays shared by all the processes of a host, from uncompressed `.npz` files.
+
+`np.load` reads the arrays of a `.npz` file into the memory of each process. `attach_npz` instead maps the file and
+returns arrays backed by the mapping, so N worker processes reading the same model (`xgboost.npz`) or per-card
+table share one copy in the page cache instead of holding N. Writing to the arrays raises an error.
+The module only depends on NumPy, so it can be shipped with the model artifacts for the predictor script.
+"""
+import mmap
+import struct
+import zipfile
+
+import numpy as np
+
+from typing import Dict
+
+_LOCAL_HEADER_SIZE = 30
+_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+
+
+def attach_npz(path: str)-> Dict[str, np.ndarray]:
+    """Read-only arrays of the `.npz` file at `path` (written by `np.savez`, not `np.savez_compressed`), backed by
+       a shared memory mapping of the file instead of copies.
+    """
+    arrays = {}
+    with open(path, "rb") as f, zipfile.ZipFile(f) as archive:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed, save it with np.savez to attach it")
+            # The data starts after the local header of the member, whose extra field can differ from the
+            # central directory's, and after the header of the .npy format.
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", f.read(_LOCAL_HEADER_SIZE)[26:30])
+            f.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version not in _HEADER_READERS:
+                raise ValueError(f"Unsupported .npy format version {version} in {path}")
+            shape, fortran_order, dtype = _HEADER_READERS[version](f)
+            if dtype.hasobject:
+                raise ValueError(f"{info.filename} holds Python objects, which can't be shared")
+            count = int(np.prod(shape))
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=f.tell()) if count else np.empty(0, dtype)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            arrays[name] = array.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
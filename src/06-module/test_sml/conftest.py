@@ -0,0 +1,37 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def transactions():
+    rng = np.random.default_rng(12345)
+    n = 300
+    cc_nums = [4444111122223333, 4444111122224444, 4444111122225555, 4444111122226666]
+    start = datetime.datetime(2022, 1, 1)
+    trans_df = pd.DataFrame({
+        "tid": [f"tid-{i}" for i in range(n)],
+        "datetime": [start + datetime.timedelta(minutes=int(m)) for m in rng.choice(60 * 24 * 120, n, replace=False)],
+        "cc_num": rng.choice(cc_nums, n),
+        "category": rng.choice(["Grocery", "Clothing", "Cash Withdrawal"], n),
+        "amount": rng.uniform(1, 1000, n).round(2),
+        "latitude": rng.uniform(25, 48, n),
+        "longitude": rng.uniform(-124, -67, n),
+        "city": "New York",
+        "country": "US",
+    })
+    trans_df["datetime"] = pd.to_datetime(trans_df["datetime"])
+    trans_df["month"] = trans_df.datetime.map(lambda x: x.strftime("%Y-%m"))
+    profiles_df = pd.DataFrame({
+        "name": ["A", "B", "C", "D"],
+        "sex": ["F", "M", "F", "M"],
+        "mail": ["a@x.com", "b@x.com", "c@x.com", "d@x.com"],
+        "birthdate": pd.to_datetime(["1950-01-01", "1970-06-15", "1985-03-03", "2000-12-31"]),
+        "City": "New York",
+        "Country": "US",
+        "cc_num": cc_nums,
+    })
+    credit_cards_df = pd.DataFrame({"cc_num": cc_nums, "provider": "visa", "expires": ["01/25", "06/24", "12/23", "03/26"]})
+    return trans_df, profiles_df, credit_cards_df
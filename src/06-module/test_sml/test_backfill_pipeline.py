@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from sml.features import cc_features
+from sml.pipelines import backfill_pipeline
+
+
+def test_backfill_by_month_matches_full_history(transactions):
+    trans_df, profiles_df, credit_cards_df = transactions
+
+    full_df, full_profiles_df = cc_features.card_owner_age(trans_df.copy(), profiles_df)
+    full_df = cc_features.expiry_days(full_df, credit_cards_df)
+    full_df = cc_features.activity_level(full_df, 1)
+    full_aggs_df = cc_features.aggregate_activity_by_hour(full_df, 4)
+    full_aggs_df["tid"] = full_df.sort_index()["tid"]
+
+    parts = list(backfill_pipeline.backfill_by_month(backfill_pipeline.split_by_month(trans_df),
+                                                     profiles_df, credit_cards_df, lag=1, window_len=4))
+    assert len(parts) == trans_df.month.nunique() + 1
+    part_df = pd.concat([p[0] for p in parts])
+    part_aggs_df = pd.concat([p[2] for p in parts])
+    part_aggs_df["tid"] = pd.concat([p[0].sort_index() for p in parts])["tid"].values
+    assert len(pd.concat([p[1] for p in parts])) == len(trans_df)
+
+    pd.testing.assert_frame_equal(part_df.sort_values("tid").reset_index(drop=True),
+                                  full_df.sort_values("tid").reset_index(drop=True))
+    pd.testing.assert_frame_equal(part_aggs_df.sort_values("tid").reset_index(drop=True),
+                                  full_aggs_df.sort_values("tid").reset_index(drop=True))
+
+
+@pytest.mark.parametrize("lag", [[1, 3], 3])
+def test_backfill_by_month_with_multiple_lags(transactions, lag):
+    trans_df, profiles_df, credit_cards_df = transactions
+
+    full_df, _ = cc_features.card_owner_age(trans_df.copy(), profiles_df)
+    full_df = cc_features.expiry_days(full_df, credit_cards_df)
+    full_df = cc_features.activity_level(full_df, [1, 3])
+
+    parts = backfill_pipeline.backfill_by_month(backfill_pipeline.split_by_month(trans_df), profiles_df, credit_cards_df,
+                                                lag=lag)
+    part_df = pd.concat([p[0] for p in parts])
+    pd.testing.assert_frame_equal(part_df.sort_values("tid").reset_index(drop=True),
+                                  full_df.sort_values("tid").reset_index(drop=True))
@@ -0,0 +1,69 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from sml.pipelines import batch_scoring
+
+
+class _FeatureView:
+
+    def __init__(self, df):
+        self.df = df
+        self.calls = 0
+
+    def get_batch_data(self, start_time, end_time):
+        self.calls += 1
+        return self.df[(self.df.datetime >= start_time) & (self.df.datetime < end_time)].reset_index(drop=True)
+
+
+def test_time_chunks_cover_the_window_once():
+    start, end = datetime.datetime(2022, 1, 1), datetime.datetime(2022, 1, 2, 3)
+    chunks = list(batch_scoring.time_chunks(start, end, datetime.timedelta(hours=6)))
+    assert len(chunks) == 5 and chunks[0][0] == start and chunks[-1] == (datetime.datetime(2022, 1, 2), end)
+    assert all(previous[1] == current[0] for previous, current in zip(chunks, chunks[1:]))
+    assert len(list(batch_scoring.time_chunks(start.date(), end.date(), datetime.timedelta(hours=6)))) == 4
+
+
+def test_chunked_scoring_matches_scoring_the_whole_window(transactions, tmp_path):
+    trans_df, _, _ = transactions
+    fv = _FeatureView(trans_df[["tid", "cc_num", "datetime", "amount", "latitude"]])
+    predict = lambda X: (X["amount"].to_numpy() > 500).astype(int)
+    start, end = trans_df.datetime.min(), trans_df.datetime.max() + datetime.timedelta(seconds=1)
+    expected = predict(trans_df.sort_values("datetime"))
+
+    seen = []
+    with batch_scoring.ParquetSink(str(tmp_path / "results.parquet")) as sink:
+        summary = batch_scoring.run_batch_scoring(
+            batch_scoring.iter_batch_data(fv, start, end, chunk=datetime.timedelta(days=7)), predict, sink,
+            drop_columns=["tid", "cc_num", "datetime"], keep_columns=["tid", "datetime"],
+            on_chunk=lambda results_df, summary: seen.append(summary["rows"]))
+
+    results_df = pd.read_parquet(tmp_path / "results.parquet")
+    assert fv.calls > 10 and summary["chunks"] == len(seen) and seen[-1] == summary["rows"] == len(trans_df)
+    assert list(results_df.columns) == ["tid", "datetime", "prediction"]
+    assert sorted(results_df.tid) == sorted(trans_df.tid)
+    np.testing.assert_array_equal(results_df.sort_values("datetime").prediction.to_numpy(), expected)
+    assert summary["counts"] == {0: int((expected == 0).sum()), 1: int((expected == 1).sum())}
+    assert summary["first_results_seconds"] <= summary["seconds"]
+
+
+class _AmountModel:
+
+    def predict(self, X):
+        return (X["amount"].to_numpy() > 500).astype(int)
+
+
+def _load_amount_model():
+    return _AmountModel()
+
+
+def test_parallel_scorer_keeps_input_order(transactions):
+    trans_df, _, _ = transactions
+    features_df = trans_df[["amount", "latitude", "longitude"]]
+    with batch_scoring.ParallelScorer(_load_amount_model, n_workers=2, block_rows=7) as scorer:
+        predictions = scorer.predict(features_df)
+        report = scorer.report
+    np.testing.assert_array_equal(predictions, _AmountModel().predict(features_df))
+    assert report["workers"] == 2 and report["rows"] == len(trans_df) and report["blocks"] == -(-len(trans_df) // 7)
+    assert report["efficiency"] == report["speedup"] / 2
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from sml.features import card_sharding
+from sml.features import cc_features
+
+
+def _events(trans_df):
+    df = trans_df.sort_values("datetime")
+    return [{"cc_num": int(row.cc_num), "datetime": cc_features.date_to_timestamp(row.datetime),
+             "longitude": row.longitude, "latitude": row.latitude, "amount": row.amount}
+            for row in df.itertuples()]
+
+
+def test_hash_ring_moves_only_the_cards_of_the_changed_worker():
+    cc_nums = np.random.default_rng(0).integers(4 * 10**15, 5 * 10**15, 20000)
+    ring = card_sharding.HashRing([0, 1, 2, 3])
+    owners = np.asarray(ring.owners(cc_nums))
+    assert ring.owners(cc_nums) == card_sharding.HashRing([0, 1, 2, 3]).owners(cc_nums)
+    assert np.bincount(owners).min() > 20000 / 4 * 0.7
+
+    grown = ring.with_workers([0, 1, 2, 3, 4])
+    moved = card_sharding.moved_cards(ring, grown, cc_nums)
+    assert set(np.asarray(grown.owners(cc_nums))[moved]) == {4}
+    assert 0.1 < moved.mean() < 0.3
+
+    shrunk = ring.with_workers([0, 1, 3])
+    moved = card_sharding.moved_cards(ring, shrunk, cc_nums)
+    np.testing.assert_array_equal(moved, owners == 2)
+
+
+def test_card_history_export_import_cards(transactions):
+    trans_df, _, _ = transactions
+    history = cc_features.CardHistory.from_frame(trans_df, depth=3)
+    other = cc_features.CardHistory(depth=3)
+    cc_nums = history.cards().tolist()
+    event = {"cc_num": cc_nums[0], "datetime": 1.7e12, "longitude": -100.0, "latitude": 40.0, "amount": 10.0}
+    expected = history.lag_features(event)
+
+    other.import_cards(history.export_cards(cc_nums[:2], remove=True))
+    assert sorted(history.cards().tolist() + other.cards().tolist()) == sorted(cc_nums)
+    assert other.lag_features(event) == expected
+    for cc_num in cc_nums[2:]:
+        assert history.lag_features({**event, "cc_num": cc_num}) == \
+            cc_features.CardHistory.from_frame(trans_df, depth=3).lag_features({**event, "cc_num": cc_num})
+
+
+def test_sharded_card_history_matches_one_history_across_rebalancing(transactions):
+    trans_df, _, _ = transactions
+    rng = np.random.default_rng(1)
+    # more cards than the fixture has, so that rebalancing moves some
+    trans_df = trans_df.assign(cc_num=rng.integers(4 * 10**15, 5 * 10**15, 60)[rng.integers(0, 60, len(trans_df))])
+    events = _events(trans_df)
+    windows = {"1d": cc_features.MILLISECONDS_PER_DAY}
+    history = cc_features.CardHistory(depth=3)
+    expected = [history.update(event, windows=windows) for event in events]
+
+    with card_sharding.ShardedCardHistory(2, depth=3) as sharded:
+        features = sharded.update(events[:150], windows=windows)
+        sizes = sharded.shard_sizes()
+        assert sharded.add_worker() == sharded.shard_sizes()[2] > 0
+        features += sharded.update(events[150:225], windows=windows)
+        assert sharded.remove_worker(0) > 0
+        features += sharded.update(events[225:], windows=windows)
+        assert sum(sharded.shard_sizes().values()) == len(history) >= sum(sizes.values())
+        assert sharded.workers == [1, 2]
+    assert features == expected
+
+
+def test_sharded_card_history_raises_worker_errors_and_keeps_serving():
+    event = {"cc_num": 4 * 10**15, "datetime": 1.7e12, "longitude": -100.0, "latitude": 40.0, "amount": 10.0}
+    with card_sharding.ShardedCardHistory(2, depth=2) as sharded:
+        other = next(cc_num for cc_num in range(4 * 10**15, 4 * 10**15 + 100)
+                     if sharded.ring.owner(cc_num) != sharded.ring.owner(event["cc_num"]))
+        broken = {key: value for key, value in event.items() if key != "datetime"}
+        with pytest.raises(KeyError):
+            sharded.update([{**event, "cc_num": other}, broken])
+        assert sharded.update([event])[0]["time_delta_t_minus_1"] == 0
+        assert sum(sharded.shard_sizes().values()) == 2
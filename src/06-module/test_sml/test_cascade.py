@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from sml.models import cascade
+
+
+def test_cascade_predicts_only_borderline_rows():
+    rules = cascade.CascadeRules(max_amount=100, max_loc_delta=0.01, min_time_delta=1.0)
+    amounts = np.array([20.0, 500.0, 20.0, 20.0])
+    loc_deltas = np.array([0.001, 0.001, 0.5, 0.001])
+    time_deltas = np.array([3.0, 3.0, 3.0, 0.001])
+    called = []
+
+    def predict(rows):
+        called.append(rows.tolist())
+        return np.ones(len(rows))
+
+    predictions, skipped = cascade.cascade_predict(rules, amounts, loc_deltas, time_deltas, predict)
+    assert predictions.tolist() == [0, 1, 1, 1] and skipped.tolist() == [True, False, False, False]
+    assert called == [[1, 2, 3]]
+
+    cascade.cascade_predict(rules, amounts[:1], loc_deltas[:1], time_deltas[:1], predict)
+    assert len(called) == 1
+
+
+def test_cascade_report_and_sweep():
+    df = pd.DataFrame({"amount": [20.0, 500.0, 20.0, 20.0], "loc_delta_t_minus_1": [0.001, 0.001, 0.5, 0.001],
+                       "time_delta_t_minus_1": [3.0, 3.0, 3.0, 0.001], "fraud_label": [0, 0, 1, 1]})
+    report = cascade.cascade_report(cascade.CascadeRules(max_amount=100, max_loc_delta=None, min_time_delta=None),
+                                    df.amount, df.loc_delta_t_minus_1, df.time_delta_t_minus_1, df.fraud_label,
+                                    predictions=[0, 0, 1, 1])
+    assert report["skip_rate"] == 0.75 and report["frauds_skipped"] == 2 and report["recall"] == 0.0
+    assert report["model_recall"] == 1.0 and report["cascade_recall"] == 0.0
+
+    sweep = cascade.sweep_cascade_rules(df, [100, 1000], [0.01], [1.0])
+    assert sweep.recall.tolist() == [1.0, 1.0] and sweep.skip_rate.tolist() == [0.5, 0.25]
+
+
+def test_cascade_rules_are_off_by_default():
+    skipped = cascade.CascadeRules().skip(np.array([1.0, 20.0]), np.array([0.0, 0.0]), np.array([10.0, 10.0]))
+    assert skipped.tolist() == [False, False]
+    assert cascade.CascadeRules(**cascade.TUNED_RULES).skip(1.0, 0.0, 10.0)
@@ -0,0 +1,125 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from sml.features import cc_features
+
+
+def test_streaming_engine_matches_activity_level(transactions):
+    trans_df, _, _ = transactions
+    trans_df = trans_df.sort_values("datetime")
+    trans_df["age_at_transaction"] = 30.0
+    trans_df["days_until_card_expires"] = 100.0
+    # `activity_level` assigns the features of each consecutive pair of transactions to the earlier one.
+    batch_df = cc_features.activity_level(trans_df.copy(), 1)
+
+    engine = cc_features.StreamingFeatureEngine(capacity=1)
+    previous_tid = {}
+    for event in trans_df.assign(datetime=batch_df.datetime.sort_index()).to_dict("records"):
+        features = engine.update(event)
+        if event["cc_num"] in previous_tid:
+            expected = batch_df[batch_df.tid == previous_tid[event["cc_num"]]].iloc[0]
+            assert features["loc_delta_t_minus_1"] == pytest.approx(expected["loc_delta_t_minus_1"])
+            assert features["time_delta_t_minus_1"] == pytest.approx(expected["time_delta_t_minus_1"])
+        else:
+            assert features == {"loc_delta_t_minus_1": 0.0, "time_delta_t_minus_1": 0.0}
+        previous_tid[event["cc_num"]] = event["tid"]
+    assert len(engine) == trans_df.cc_num.nunique()
+
+
+def test_streaming_engine_snapshot_round_trip(transactions, tmp_path):
+    trans_df, _, _ = transactions
+    trans_df["datetime"] = trans_df.datetime.map(lambda x: cc_features.date_to_timestamp(x))
+    engine = cc_features.StreamingFeatureEngine.from_frame(trans_df)
+    engine.snapshot(tmp_path / "engine.npz")
+    restored = cc_features.StreamingFeatureEngine.load(tmp_path / "engine.npz")
+
+    event = {"cc_num": trans_df.cc_num.iloc[0], "datetime": trans_df.datetime.max() + 60000,
+             "longitude": -73.79, "latitude": 41.0}
+    assert restored.lag_features(event) == engine.lag_features(event)
+    restored.record({**event, "datetime": event["datetime"] - 10 ** 10})
+    assert restored.lag_features(event) == engine.lag_features(event)
+
+
+def test_pair_lag_features_batch_matches_pair_lag_features():
+    rng = np.random.default_rng(0)
+    n = 200
+    longs, lats = rng.uniform(-180, 180, (2, n))
+    prev_longs, prev_lats = rng.uniform(-90, 90, (2, n))
+    datetimes = rng.integers(10**12, 2 * 10**12, n)
+    prev_datetimes = datetimes - rng.integers(0, 10**10, n)
+
+    batch = cc_features.pair_lag_features_batch(datetimes, longs, lats, prev_datetimes, prev_longs, prev_lats)
+    pairs = [cc_features.pair_lag_features({"datetime": datetimes[i], "longitude": longs[i], "latitude": lats[i]},
+                                           prev_datetimes[i], prev_longs[i], prev_lats[i]) for i in range(n)]
+    for name in ["loc_delta_t_minus_1", "time_delta_t_minus_1"]:
+        np.testing.assert_array_equal(batch[name], [pair[name] for pair in pairs])
+
+
+def test_activity_level_multiple_lags_match_single_lags(transactions):
+    trans_df, _, _ = transactions
+    trans_df["age_at_transaction"] = 30.0
+    trans_df["days_until_card_expires"] = 100.0
+
+    multi_df = cc_features.activity_level(trans_df.copy(), {1, 2, 5})
+    assert list(multi_df.columns[-6:]) == ["loc_delta_t_minus_1", "time_delta_t_minus_1", "loc_delta_t_minus_2",
+                                           "time_delta_t_minus_2", "loc_delta_t_minus_5", "time_delta_t_minus_5"]
+    for lag in [1, 2, 5]:
+        single_df = cc_features.activity_level(trans_df.copy(), lag)
+        pd.testing.assert_frame_equal(multi_df[single_df.columns], single_df)
+
+
+def test_card_static_features_match_batch_features(transactions, tmp_path):
+    trans_df, profiles_df, credit_cards_df = transactions
+    trans_df, _ = cc_features.card_owner_age(trans_df.copy(), profiles_df.copy())
+    trans_df = cc_features.expiry_days(trans_df, credit_cards_df)
+    datetimes = trans_df["datetime"].map(cc_features.date_to_timestamp)
+
+    cards = cc_features.CardStaticFeatures.from_frames(profiles_df, credit_cards_df)
+    features = cards.features_batch(trans_df["cc_num"], datetimes)
+    np.testing.assert_array_equal(features["age_at_transaction"], trans_df["age_at_transaction"])
+    np.testing.assert_array_equal(features["days_until_card_expires"], trans_df["days_until_card_expires"])
+    assert features["sex"].tolist() == trans_df["cc_num"].map(profiles_df.set_index("cc_num")["sex"]).tolist()
+
+    # The expiry dates can be recovered from the transactions feature group.
+    expiry_df = cc_features.card_expiry_from_transactions(trans_df.assign(datetime=datetimes))
+    np.testing.assert_array_equal(cc_features.CardStaticFeatures.from_frames(profiles_df, expiry_df).expires, cards.expires)
+
+    cards.snapshot(str(tmp_path / "cards.npz"))
+    loaded = cc_features.CardStaticFeatures.load(str(tmp_path / "cards.npz"))
+    row = trans_df.iloc[0]
+    assert loaded.features(row["cc_num"], datetimes.iloc[0]) == {"age_at_transaction": row["age_at_transaction"],
+                                                                 "days_until_card_expires": row["days_until_card_expires"],
+                                                                 "sex": profiles_df.set_index("cc_num").loc[row["cc_num"], "sex"]}
+    assert 1234 not in loaded
+
+
+def test_card_history_matches_activity_level_lags(transactions):
+    trans_df, _, _ = transactions
+    trans_df = trans_df.sort_values("datetime")
+    trans_df["age_at_transaction"] = 30.0
+    trans_df["days_until_card_expires"] = 100.0
+    batch_df = cc_features.activity_level(trans_df.copy(), [1, 2, 3]).set_index("tid")
+    events = trans_df.assign(datetime=trans_df.datetime.map(cc_features.date_to_timestamp)).to_dict("records")
+
+    history = cc_features.CardHistory(depth=3, capacity=1)
+    previous_tids = {}
+    for event in events:
+        features = history.update(event, windows={"1d": cc_features.MILLISECONDS_PER_DAY})
+        tids = previous_tids.setdefault(event["cc_num"], [])
+        for lag in [1, 2, 3]:
+            # `activity_level` assigns the features of each pair of transactions to the earlier one.
+            expected = batch_df.loc[tids[-lag]] if len(tids) >= lag else {f"loc_delta_t_minus_{lag}": 0.0,
+                                                                            f"time_delta_t_minus_{lag}": 0.0}
+            assert features[f"loc_delta_t_minus_{lag}"] == pytest.approx(expected[f"loc_delta_t_minus_{lag}"])
+            assert features[f"time_delta_t_minus_{lag}"] == pytest.approx(expected[f"time_delta_t_minus_{lag}"])
+        recent = [e for e in events if e["cc_num"] == event["cc_num"] and e["tid"] in tids[-3:]
+                  and event["datetime"] - e["datetime"] <= cc_features.MILLISECONDS_PER_DAY]
+        assert features["trans_count_1d"] == len(recent)
+        assert features["trans_amount_1d"] == pytest.approx(sum(e["amount"] for e in recent))
+        tids.append(event["tid"])
+
+    restored = cc_features.CardHistory.from_frame(pd.DataFrame(events), depth=3)
+    event = {**events[-1], "datetime": events[-1]["datetime"] + 60000}
+    assert restored.lag_features(event, windows={"1d": cc_features.MILLISECONDS_PER_DAY}) == \
+        history.lag_features(event, windows={"1d": cc_features.MILLISECONDS_PER_DAY})
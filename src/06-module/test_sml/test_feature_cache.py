@@ -0,0 +1,96 @@
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from sml.features import feature_cache
+
+
+class FakeFeatureView:
+
+    def __init__(self, name, version=1):
+        self.name = name
+        self.version = version
+        self.lookups = 0
+
+    def get_feature_vector(self, entry):
+        self.lookups += 1
+        return [entry["cc_num"], self.lookups]
+
+
+def test_lru_eviction():
+    backend = feature_cache.InMemoryBackend(max_size=2)
+    cache = feature_cache.FeatureVectorCache(backend=backend)
+    cache.put("fv", 1, {"cc_num": 1}, [1])
+    cache.put("fv", 1, {"cc_num": 2}, [2])
+    assert cache.get("fv", 1, {"cc_num": 1}) == [1]
+    cache.put("fv", 1, {"cc_num": 3}, [3])
+    assert len(backend) == 2
+    assert cache.get("fv", 1, {"cc_num": 2}) is None
+    assert cache.get("fv", 1, {"cc_num": 1}) == [1]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_ttl_per_feature_view():
+    now = [0.0]
+    cache = feature_cache.FeatureVectorCache(ttls={"short": 5, "forever": None, "off": 0}, clock=lambda: now[0])
+    for name in ["short", "forever", "off"]:
+        cache.put(name, 1, {"cc_num": 1}, [name])
+    assert cache.get("short", 1, {"cc_num": 1}) == ["short"]
+    assert cache.get("off", 1, {"cc_num": 1}) is None
+    now[0] = 10.0
+    assert cache.get("short", 1, {"cc_num": 1}) is None
+    assert cache.get("forever", 1, {"cc_num": 1}) == ["forever"]
+
+
+def test_get_feature_vector_and_insert_invalidation():
+    fv = FakeFeatureView("latest_recorded_transactions_fraud_online_fv")
+    cache = feature_cache.FeatureVectorCache()
+    assert cache.get_feature_vector(fv, {"cc_num": 1}) == [1, 1]
+    assert cache.get_feature_vector(fv, {"cc_num": np.int64(1)}) == [1, 1]
+    assert fv.lookups == 1
+
+    inserted = pd.DataFrame({"datetime": [0], "cc_num": [1], "latitude": [41.0], "longitude": [-73.8]})
+    cache.invalidate_rows(inserted, [(fv.name, fv.version)])
+    assert cache.get_feature_vector(fv, {"cc_num": 1}) == [1, 2]
+
+
+def test_concurrent_lookups_and_invalidation():
+    cache = feature_cache.FeatureVectorCache(backend=feature_cache.InMemoryBackend(max_size=8))
+    fv = FakeFeatureView("fv")
+    errors = []
+    stop = threading.Event()
+
+    def look_up(seed):
+        rng = np.random.default_rng(seed)
+        try:
+            for cc_num in rng.integers(0, 32, 5000).tolist():
+                assert cache.get_feature_vector(fv, {"cc_num": cc_num})[0] == cc_num
+        except Exception as err:
+            errors.append(err)
+
+    def invalidate():
+        try:
+            while not stop.is_set():
+                cache.invalidate_rows(pd.DataFrame({"cc_num": range(0, 32, 3)}), [("fv", 1)])
+                cache.invalidate_feature_view("fv")
+        except Exception as err:
+            errors.append(err)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        invalidator = threading.Thread(target=invalidate)
+        invalidator.start()
+        lookups = [threading.Thread(target=look_up, args=(seed,)) for seed in range(4)]
+        for thread in lookups:
+            thread.start()
+        for thread in lookups:
+            thread.join()
+        stop.set()
+        invalidator.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == [] and len(cache.backend) <= 8
+    assert cache.hits + cache.misses == 4 * 5000
@@ -0,0 +1,35 @@
+import numpy as np
+
+from sml.latency import Histogram, LatencyRecorder
+
+
+def test_histogram_quantiles_within_precision():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(mean=7, sigma=1.5, size=20000).astype(int)
+    histogram = Histogram(precision_bits=7)
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == len(values) and histogram.max == values.max()
+    for q in (0.5, 0.9, 0.99):
+        exact = np.quantile(values, q, method="inverted_cdf")
+        assert exact <= histogram.quantile(q) <= exact * (1 + 2 ** -6) + 1
+
+
+def test_recorder_timers_and_snapshots():
+    recorder = LatencyRecorder()
+
+    @recorder.timed("model")
+    def predict(x):
+        return x * 2
+
+    with recorder.timer("feature_vector"):
+        assert predict(2) == 4
+    snapshot = recorder.snapshot()
+    assert sorted(snapshot) == ["feature_vector", "model"] and snapshot["model"]["count"] == 1
+    assert snapshot["feature_vector"]["max_ms"] >= snapshot["model"]["max_ms"]
+    assert 'sml_stage_latency_seconds_count{stage="model"} 1' in recorder.to_prometheus()
+
+    recorder.enabled = False
+    with recorder.timer("feature_vector"):
+        predict(1)
+    assert recorder.snapshot()["model"]["count"] == 1
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+import pytest
+
+from sml.features import cc_features
+from sml.features import online_features
+
+FEATURE_NAMES = ["cc_num", "datetime", "amount", "loc_delta_t_minus_1", "time_delta_t_minus_1", "sex"]
+
+
+class FakeFeatureView:
+
+    def __init__(self, vector, barrier=None):
+        self.vector = vector
+        self.barrier = barrier
+
+    def get_feature_vector(self, entry):
+        # with a barrier, the lookup returns only once the other lookup is running too
+        if self.barrier is not None:
+            self.barrier.wait()
+        return list(self.vector)
+
+
+def test_apply_passed_features_by_name():
+    vector = online_features.apply_passed_features([1, 2, 3.0, 0.5, 0.5, 1], FEATURE_NAMES,
+                                                   {"loc_delta_t_minus_1": 0.2, "unknown": 7},
+                                                   {"loc_delta_t_minus_1": lambda x: x * 10})
+    assert vector == [1, 2, 3.0, 2.0, 0.5, 1]
+
+
+def test_lookups_run_concurrently():
+    # run one after the other, the first lookup would wait for the second one until the barrier times out
+    barrier = threading.Barrier(2, timeout=10)
+    latest_record_fv = FakeFeatureView([1_000_000, 42, 41.0, -73.8], barrier)
+    fv = FakeFeatureView([42, 1_000_000, 35.0, 0.0, 0.0, 1], barrier)
+    current_datetime = 1_000_000 + 2 * cc_features.MILLISECONDS_PER_DAY
+
+    vector = online_features.get_feature_vector_concurrent(fv, latest_record_fv, 42, current_datetime, -73.9, 41.1,
+                                                           feature_names=FEATURE_NAMES)
+
+    expected = cc_features.pair_lag_features({"datetime": current_datetime, "longitude": -73.9, "latitude": 41.1},
+                                             1_000_000, -73.8, 41.0)
+    assert vector == [42, 1_000_000, 35.0, expected["loc_delta_t_minus_1"], 2.0, 1]
+    assert asyncio.run(online_features.get_feature_vector_async(fv, latest_record_fv, 42, current_datetime, -73.9, 41.1,
+                                                                feature_names=FEATURE_NAMES)) == vector
+
+
+class TransformationFunction:
+
+    def __init__(self, transformation_fn):
+        self.transformation_fn = transformation_fn
+
+
+def test_passed_features_go_through_the_feature_view_transformations():
+    latest_record_fv = FakeFeatureView([1_000_000, 42, 41.0, -73.8])
+    fv = FakeFeatureView([42, 1_000_000, 0.35, 0.0, 0.0, 1])
+    fv.transformation_functions = {"amount": TransformationFunction(lambda x: x / 100),
+                                   "time_delta_t_minus_1": TransformationFunction(lambda x: x / 10)}
+    lookups = []
+
+    def lookup(feature_view, entry):
+        lookups.append(feature_view)
+        return feature_view.get_feature_vector(entry)
+
+    current_datetime = 1_000_000 + 2 * cc_features.MILLISECONDS_PER_DAY
+    vector = online_features.get_feature_vector_concurrent(fv, latest_record_fv, 42, current_datetime, -73.8, 41.0,
+                                                           feature_names=FEATURE_NAMES, passed_features={"amount": 70.0},
+                                                           lookup=lookup)
+    assert vector == [42, 1_000_000, 0.7, 0.0, 0.2, 1]
+    assert sorted(map(id, lookups)) == sorted([id(fv), id(latest_record_fv)])
+    assert online_features.get_feature_vector_concurrent(fv, latest_record_fv, 42, current_datetime, -73.8, 41.0,
+                                                         feature_names=FEATURE_NAMES, passed_features={"amount": 70.0},
+                                                         transformations={}) == [42, 1_000_000, 70.0, 0.0, 2.0, 1]
+
+
+class TableFeatureView:
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def get_feature_vectors(self, entries):
+        self.calls += 1
+        return [list(self.vectors[entry["cc_num"]]) if entry["cc_num"] in self.vectors else None for entry in entries]
+
+
+def test_score_bulk_matches_single_lookups():
+    latest_record_fv = TableFeatureView({42: [1_000_000, 42, 41.0, -73.8], 7: [2_000_000, 7, 40.0, -74.0]})
+    fv = TableFeatureView({42: [42, 1_000_000, 35.0, 0.0, 0.0, 1], 7: [7, 2_000_000, 12.0, 0.0, 0.0, 0],
+                           9: [9, 0, 5.0, 0.0, 0.0, 1]})
+    day = cc_features.MILLISECONDS_PER_DAY
+    cc_nums = [42, 7, 42, 9]
+    datetimes = [1_000_000 + 2 * day, 2_000_000 + day, 1_000_000 + 3 * day, 3 * day]
+    amounts = [10.0, 20.0, 30.0, 40.0]
+    longs, lats = [-73.9, -74.1, -73.0, -70.0], [41.1, 40.2, 41.5, 39.0]
+
+    matrix, feature_names = online_features.get_feature_matrix(fv, latest_record_fv, cc_nums, datetimes, amounts,
+                                                               longs, lats, feature_names=FEATURE_NAMES)
+    assert feature_names == FEATURE_NAMES and (fv.calls, latest_record_fv.calls) == (1, 1)
+    first = cc_features.pair_lag_features({"datetime": datetimes[0], "longitude": longs[0], "latitude": lats[0]},
+                                          1_000_000, -73.8, 41.0)
+    # The second transaction of card 42 follows its first one in the same request.
+    second = cc_features.pair_lag_features({"datetime": datetimes[2], "longitude": longs[2], "latitude": lats[2]},
+                                           datetimes[0], longs[0], lats[0])
+    assert list(matrix[0]) == [42, 1_000_000, 10.0, first["loc_delta_t_minus_1"], 2.0, 1]
+    assert list(matrix[2]) == [42, 1_000_000, 30.0, second["loc_delta_t_minus_1"], 1.0, 1]
+    # Cards without a recorded transaction get zero lag features.
+    assert list(matrix[3]) == [9, 0, 40.0, 0.0, 0.0, 1]
+
+    predictions = online_features.score_bulk(lambda X: X.sum(axis=1), fv, latest_record_fv, cc_nums, datetimes,
+                                             amounts, longs, lats, feature_names=FEATURE_NAMES)
+    assert predictions.shape == (4,) and predictions[3] == 41.0
+
+
+def test_get_feature_matrix_reports_cards_without_feature_vector():
+    latest_record_fv = TableFeatureView({42: [1_000_000, 42, 41.0, -73.8]})
+    fv = TableFeatureView({42: [42, 1_000_000, 35.0, 0.0, 0.0, 1]})
+    with pytest.raises(KeyError, match=r"\[5, 8\]"):
+        online_features.get_feature_matrix(fv, latest_record_fv, [42, 8, 5], [2_000_000] * 3, [1.0] * 3,
+                                           [-73.9] * 3, [41.1] * 3, feature_names=FEATURE_NAMES)
+
+
+def test_feature_vector_layout_selects_model_inputs_by_name():
+    model_schema = {"input_schema": {"columnar_schema": [{"name": "sex", "type": "int64"},
+                                                         {"name": "amount", "type": "float64"}]}}
+    layout = online_features.FeatureVectorLayout(FEATURE_NAMES, online_features.model_input_names(model_schema))
+    row = layout.fill([42, 1_000_000, 35.0, 0.1, 0.2, 1])
+    assert row.tolist() == [1.0, 35.0]
+    assert layout.fill([7, 0, 12.0, 0.0, 0.0, 0]) is row and row.tolist() == [0.0, 12.0]
+    layout.set(row, "amount", 3.0)
+    assert row.tolist() == [0.0, 3.0]
+
+    batch = layout.fill_batch([[42, 1_000_000, 35.0, 0.1, 0.2, 1], [7, 0, 12.0, 0.0, 0.0, 0]])
+    assert batch.tolist() == [[1.0, 35.0], [0.0, 12.0]]
+    assert online_features.FeatureVectorLayout(FEATURE_NAMES).model_feature_names == FEATURE_NAMES[2:]
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from multiprocessing.shared_memory import SharedMemory
+
+from sml.features import cc_features
+from sml.features import parallel_features
+
+
+def test_shard_by_cc_num_keeps_cards_together(transactions):
+    trans_df, _, _ = transactions
+    shards = parallel_features.shard_by_cc_num(trans_df, 3)
+    assert sum(len(s) for s in shards) == len(trans_df)
+    cards = [set(trans_df.cc_num.iloc[s]) for s in shards]
+    assert all(a.isdisjoint(b) for i, a in enumerate(cards) for b in cards[i + 1:])
+
+
+def test_parallel_features_match_serial(transactions):
+    trans_df, _, _ = transactions
+    trans_df["age_at_transaction"] = 30.0
+    trans_df["days_until_card_expires"] = 100.0
+
+    serial_df = cc_features.activity_level(trans_df.copy(), 1)
+    parallel_df = parallel_features.activity_level(trans_df.copy(), 1, n_workers=2)
+    pd.testing.assert_frame_equal(parallel_df, serial_df)
+
+    serial_aggs_df = cc_features.aggregate_activity_by_hour(serial_df, 4)
+    parallel_aggs_df = parallel_features.aggregate_activity_by_hour(serial_df, 4, n_workers=2)
+    pd.testing.assert_frame_equal(parallel_aggs_df, serial_aggs_df)
+
+
+def test_map_shards_unlinks_written_blocks_when_writing_fails(transactions, monkeypatch):
+    trans_df, _, _ = transactions
+    write_shared_frame = parallel_features._write_shared_frame
+    written = []
+
+    def fail_after_first(df):
+        if written:
+            raise MemoryError("no space left for shared memory")
+        written.append(write_shared_frame(df))
+        return written[-1]
+
+    monkeypatch.setattr(parallel_features, "_write_shared_frame", fail_after_first)
+    with pytest.raises(MemoryError):
+        parallel_features.map_shards(trans_df, cc_features.activity_level, 1, n_workers=3)
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=written[0][0])
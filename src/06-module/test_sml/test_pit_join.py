@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from sml.features import cc_features
+from sml.features import pit_join
+
+
+@pytest.fixture
+def feature_frames(transactions):
+    trans_df, profiles_df, credit_cards_df = transactions
+    trans_df, profiles_df = cc_features.card_owner_age(trans_df, profiles_df)
+    trans_df = cc_features.expiry_days(trans_df, credit_cards_df)
+    trans_df = cc_features.activity_level(trans_df, 1)
+    window_aggs_df = cc_features.aggregate_activity_by_hour(trans_df, 4)
+    profiles_df.datetime = profiles_df.datetime.map(lambda x: cc_features.date_to_timestamp(x))
+    labels_df = trans_df[["tid", "cc_num", "datetime", "month"]].assign(fraud_label=(trans_df.amount > 900).astype(int))
+    return labels_df, trans_df, window_aggs_df, profiles_df
+
+
+def _brute_force_join(label_df, feature_df, tolerance=None):
+    rows = []
+    for label in label_df.itertuples(index=False):
+        candidates = feature_df[(feature_df.cc_num == label.cc_num) & (feature_df.datetime <= label.datetime)]
+        if tolerance is not None:
+            candidates = candidates[candidates.datetime >= label.datetime - tolerance]
+        rows.append(candidates.sort_values("datetime", kind="mergesort").drop(columns=["cc_num", "datetime"]).tail(1)
+                    .reset_index(drop=True).reindex([0]))
+    return pd.concat(rows, ignore_index=True)
+
+
+@pytest.mark.parametrize("chunk_size, tolerance", [(None, None), (7, None), (50, 3 * 24 * 3600 * 1000)])
+def test_point_in_time_join_matches_brute_force(feature_frames, chunk_size, tolerance):
+    labels_df, _, window_aggs_df, _ = feature_frames
+    # Shift the labels, so they fall between feature rows.
+    labels_df = labels_df[["cc_num", "datetime"]].assign(datetime=labels_df.datetime + 3600 * 1000).sample(frac=1, random_state=1)
+    joined_df = pit_join.point_in_time_join(labels_df, [window_aggs_df.drop(columns=["month"])],
+                                            tolerance=tolerance, chunk_size=chunk_size)
+
+    expected_df = _brute_force_join(joined_df[["cc_num", "datetime"]], window_aggs_df.drop(columns=["month"]), tolerance)
+    pd.testing.assert_frame_equal(joined_df.drop(columns=["cc_num", "datetime"]), expected_df)
+
+
+def test_create_fraud_training_data(feature_frames):
+    labels_df, trans_df, window_aggs_df, profiles_df = feature_frames
+    X, y = pit_join.create_fraud_training_data(labels_df, trans_df, window_aggs_df, profiles_df, chunk_size=64)
+
+    assert list(X.columns) == ["cc_num", "datetime", "category", "amount", "age_at_transaction", "days_until_card_expires",
+                               "loc_delta_t_minus_1", "time_delta_t_minus_1", "trans_volume_mstd", "trans_volume_mavg",
+                               "trans_freq", "loc_delta_mavg", "sex"]
+    assert len(X) == len(y) == len(labels_df)
+    assert X.amount.notna().all() and X.sex.notna().all()
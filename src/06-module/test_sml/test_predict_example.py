@@ -0,0 +1,39 @@
+import os
+import sys
+
+import joblib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "notebooks"))
+import predict_example  # noqa: E402
+
+
+class _FirstColumnModel:
+    n_features_in_ = 3
+
+    def predict(self, X):
+        return np.asarray(X)[:, 0].astype(int)
+
+
+@pytest.fixture
+def predictor(tmp_path, monkeypatch):
+    joblib.dump(_FirstColumnModel(), tmp_path / "xgboost.pkl")
+    monkeypatch.setenv("ARTIFACT_FILES_PATH", str(tmp_path))
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    return predict_example.Predict()
+
+
+def test_predict_scores_a_batch_in_request_order(predictor):
+    inputs = [[i, 0.5, 1.0] for i in [5, 3, 9, 1]]
+    assert predictor.predict(inputs) == [5, 3, 9, 1]
+
+
+def test_predict_scores_a_single_vector(predictor):
+    assert predictor.predict([7, 0.5, 1.0]) == [7]
+
+
+@pytest.mark.parametrize("inputs", [[1, 2], [[1, 2, 3, 4]], [[[1, 2, 3]]]])
+def test_predict_rejects_wrong_widths(predictor, inputs):
+    with pytest.raises(ValueError):
+        predictor.predict(inputs)
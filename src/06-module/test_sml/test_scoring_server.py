@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "notebooks"))
+import scoring_server  # noqa: E402
+
+
+class _SumPredictor:
+    n_features = 3
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, inputs):
+        batch = np.asarray(inputs, dtype=np.float64)
+        self.calls.append(len(batch))
+        if np.isnan(batch).any():
+            raise ValueError("NaN in the batch")
+        return batch.sum(axis=1).tolist()
+
+
+async def _predict_all(batcher, requests):
+    task = asyncio.create_task(batcher.run())
+    try:
+        return await asyncio.gather(*(batcher.predict(inputs) for inputs in requests), return_exceptions=True)
+    finally:
+        task.cancel()
+
+
+def test_micro_batcher_scores_requests_together():
+    predictor = _SumPredictor()
+    batcher = scoring_server.MicroBatcher(predictor, max_batch_size=64, max_wait_ms=50)
+    results = asyncio.run(_predict_all(batcher, [[1, 2, 3], [[1, 1, 1], [2, 2, 2]], [0, 0, 1]]))
+    assert results == [[6.0], [3.0, 6.0], [1.0]]
+    assert predictor.calls == [4]
+
+
+def test_micro_batcher_rejects_bad_requests_without_failing_the_batch():
+    predictor = _SumPredictor()
+    batcher = scoring_server.MicroBatcher(predictor, max_batch_size=64, max_wait_ms=50)
+    results = asyncio.run(_predict_all(batcher, [[1, 2, 3], ["x", "y", "z"], [1, 2], [[1, 2, 3], [1, 2]]]))
+    assert results[0] == [6.0]
+    assert all(isinstance(result, ValueError) for result in results[1:])
+
+    # a request the model itself fails on is scored alone, so the others of its batch still succeed
+    batcher = scoring_server.MicroBatcher(predictor, max_batch_size=64, max_wait_ms=50)
+    results = asyncio.run(_predict_all(batcher, [[1, 2, 3], [float("nan"), 0, 0], [1, 1, 1]]))
+    assert results[0] == [6.0] and results[2] == [3.0] and isinstance(results[1], ValueError)
+
+
+class _FailingPredictor(_SumPredictor):
+
+    def predict(self, inputs):
+        raise RuntimeError("model unavailable")
+
+
+async def _request(handler, request_line, body=None):
+    reader = asyncio.StreamReader()
+    payload = json.dumps(body).encode() if body is not None else b""
+    reader.feed_data(b"%s\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % (request_line, len(payload))
+                     + payload)
+    reader.feed_eof()
+
+    class _Writer:
+        data = b""
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+        def close(self):
+            pass
+
+    writer = _Writer()
+    await handler(reader, writer)
+    return writer.data.decode()
+
+
+async def _post(handler, body):
+    response = await _request(handler, b"POST /predict HTTP/1.1", body)
+    return response.split("\r\n", 1)[0]
+
+
+@pytest.mark.parametrize("predictor, body, status", [
+    (_SumPredictor(), {"inputs": [1, 2, 3]}, "HTTP/1.1 200 OK"),
+    (_SumPredictor(), {"inputs": ["x", 2, 3]}, "HTTP/1.1 400 Bad Request"),
+    (_FailingPredictor(), {"inputs": [1, 2, 3]}, "HTTP/1.1 500 Internal Server Error"),
+])
+def test_handler_statuses(predictor, body, status):
+    async def run():
+        batcher = scoring_server.MicroBatcher(predictor, max_wait_ms=1)
+        task = asyncio.create_task(batcher.run())
+        try:
+            return await _post(scoring_server.make_handler(batcher), body)
+        finally:
+            task.cancel()
+    assert asyncio.run(run()) == status
+
+
+def test_metrics_without_a_predictor_recorder():
+    async def run():
+        batcher = scoring_server.MicroBatcher(_SumPredictor(), max_wait_ms=1)
+        handler = scoring_server.make_handler(batcher)
+        task = asyncio.create_task(batcher.run())
+        try:
+            await _post(handler, {"inputs": [1, 2, 3]})
+            return await _request(handler, b"GET /metrics HTTP/1.1")
+        finally:
+            task.cancel()
+    response = asyncio.run(run())
+    assert response.startswith("HTTP/1.1 200 OK") and 'stage="request"' in response
@@ -0,0 +1,43 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from sml import shared_arrays
+from sml.features import cc_features
+
+
+def _checksum(path):
+    return float(shared_arrays.attach_npz(path)["values"].sum())
+
+
+def test_attach_npz_is_read_only_and_shared(tmp_path):
+    path = str(tmp_path / "arrays.npz")
+    values = np.random.default_rng(0).normal(size=(100, 7))
+    np.savez(path, values=values, fortran=np.asfortranarray(values), names=np.array(["F", "M"]), empty=np.zeros(0))
+
+    arrays = shared_arrays.attach_npz(path)
+    np.testing.assert_array_equal(arrays["values"], values)
+    np.testing.assert_array_equal(arrays["fortran"], values)
+    assert arrays["names"].tolist() == ["F", "M"] and arrays["empty"].shape == (0,)
+    with pytest.raises(ValueError):
+        arrays["values"][0, 0] = 1.0
+
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        assert pool.map(_checksum, [path, path]) == [float(values.sum())] * 2
+
+    np.savez_compressed(path, values=values)
+    with pytest.raises(ValueError):
+        shared_arrays.attach_npz(path)
+
+
+def test_card_static_features_attach_snapshot(transactions, tmp_path):
+    _, profiles_df, credit_cards_df = transactions
+    cards = cc_features.CardStaticFeatures.from_frames(profiles_df, credit_cards_df)
+    cards.snapshot(str(tmp_path / "cards.npz"))
+    shared = cc_features.CardStaticFeatures.load(str(tmp_path / "cards.npz"), shared=True)
+    assert not shared.birthdates.flags.writeable
+    cc_nums = profiles_df["cc_num"].to_numpy()
+    datetimes = np.full(len(cc_nums), 1_650_000_000_000)
+    for name, values in shared.features_batch(cc_nums, datetimes).items():
+        np.testing.assert_array_equal(values, cards.features_batch(cc_nums, datetimes)[name])
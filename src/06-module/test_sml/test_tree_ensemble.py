@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from sml.models import tree_ensemble
+
+xgb = pytest.importorskip("xgboost")
+
+
+def test_tree_ensemble_matches_booster(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 6)) * [1e-4, 1e-2, 1, 10, 100, 1]
+    y = (X[:, 0] * 1e4 + X[:, 2] + rng.normal(size=len(X)) > 0.5).astype(int)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    clf = xgb.XGBClassifier(n_estimators=30, max_depth=4).fit(X, y)
+
+    path = str(tmp_path / "xgboost.npz")
+    tree_ensemble.save_xgboost(clf, path)
+    model = tree_ensemble.TreeEnsemble.load(path)
+
+    margin = clf.get_booster().predict(xgb.DMatrix(X), output_margin=True)
+    assert np.array_equal(model.margin(X), margin)
+    assert np.array_equal(model.predict(X), clf.predict(X))
+    np.testing.assert_allclose(model.predict_proba(X), clf.predict_proba(X), rtol=1e-6)
+    assert model.predict(X[0]).tolist() == clf.predict(X[:1]).tolist()
+    assert model.n_features_in_ == 6
+    assert np.array_equal(tree_ensemble.TreeEnsemble.load(path, shared=True).margin(X), margin)
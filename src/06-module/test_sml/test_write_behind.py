@@ -0,0 +1,57 @@
+import time
+
+import pandas as pd
+
+from sml.features.write_behind import WriteBehindBuffer
+
+
+class FakeFeatureGroup:
+
+    def __init__(self, fail=False):
+        self.inserts = []
+        self.fail = fail
+
+    def insert(self, df, write_options=None):
+        if self.fail:
+            raise ConnectionError("feature store unavailable")
+        self.inserts.append(df)
+
+
+def _row(cc_num, datetime, latitude=41.0, longitude=-73.9):
+    return {"datetime": datetime, "cc_num": cc_num, "latitude": latitude, "longitude": longitude}
+
+
+def test_keeps_latest_update_per_card_and_flushes_on_size(tmp_path):
+    fg = FakeFeatureGroup()
+    flushed = []
+    with WriteBehindBuffer(fg, str(tmp_path / "updates.log"), max_rows=2, max_delay=60, on_flush=flushed.append) as buffer:
+        buffer.put(pd.DataFrame([_row(1, 20, latitude=1.0), _row(1, 10, latitude=2.0)]))
+        assert len(buffer) == 1 and fg.inserts == []
+        buffer.put(_row(2, 5))
+        deadline = time.monotonic() + 5
+        while not fg.inserts and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert len(fg.inserts) == 1 and flushed == fg.inserts
+    assert fg.inserts[0].sort_values("cc_num").to_dict("records") == [_row(1, 20, latitude=1.0), _row(2, 5)]
+    assert (tmp_path / "updates.log").read_text() == ""
+
+
+def test_recovers_updates_not_inserted(tmp_path):
+    log_path = str(tmp_path / "updates.log")
+    buffer = WriteBehindBuffer(FakeFeatureGroup(fail=True), log_path, max_rows=100, max_delay=60)
+    buffer.put(_row(1, 10))
+    buffer.put(_row(1, 30))
+    assert buffer.flush() == 0 and len(buffer) == 1 and len(buffer.errors) == 1
+    # the process stops without inserting, and a partial line is left at the end of the log
+    with open(log_path, "a") as log:
+        log.write('{"datetime": 4')
+
+    # and the next process stops too, after one more update
+    recovered = WriteBehindBuffer(FakeFeatureGroup(fail=True), log_path, max_rows=100, max_delay=60)
+    assert len(recovered) == 1
+    recovered.put(_row(2, 20))
+
+    fg = FakeFeatureGroup()
+    with WriteBehindBuffer(fg, log_path, max_rows=100, max_delay=60) as recovered:
+        assert len(recovered) == 2
+    assert [df.sort_values("cc_num").to_dict("records") for df in fg.inserts] == [[_row(1, 30), _row(2, 20)]]